@@ -1,8 +1,33 @@
 import os
 import argparse
+from functools import partial
 from tqdm import tqdm
 
 from regio import seppy
+from sep_io import concat_files
+from shot_dataset import rank_suffixes
+from utils import pmap
+
+
+def _rank_files(data_dir, key):
+  """
+  Returns the sorted per-rank SEP files of an output
+
+  Combined files (e.g., key_all_combined.H, key_all_combined_interp.H) are
+  not per-rank files and are skipped
+  """
+  return [
+      os.path.join(data_dir, key + suffix) for suffix in rank_suffixes(data_dir)
+  ]
+
+
+def _stream_key(key, data_dir, block_mb):
+  """ Concatenates the per-rank files of an output as bytes """
+  files = _rank_files(data_dir, key)
+  output_file = os.path.join(data_dir, key + '_all_combined.H')
+  if len(files) > 0:
+    concat_files(files, output_file, block=block_mb * 2**20)
+  return key, len(files)
 
 
 def main(args):
@@ -14,13 +39,20 @@ def main(args):
       'f3_strm'
   ]
 
+  if args.stream:
+    # Copy the binary files without reading them (one key per worker)
+    stream = partial(_stream_key,
+                     data_dir=args.data_dir,
+                     block_mb=args.block_mb)
+    for key, nfiles in tqdm(pmap(stream, keys, args.workers),
+                            desc='keys',
+                            total=len(keys)):
+      print("Combined %d %s files" % (nfiles, key))
+    return
+
   for key in keys:
 
-    files = sorted([
-        os.path.join(args.data_dir, ifile)
-        for ifile in os.listdir(args.data_dir)
-        if key in ifile
-    ])
+    files = _rank_files(args.data_dir, key)
 
     output_file = os.path.join(args.data_dir, key + '_all_combined.H')
     for k, ifile in tqdm(enumerate(files),
@@ -37,6 +69,25 @@ def main(args):
 def attach_args(parser=argparse.ArgumentParser()):
   path = "/net/brick5/data3/northsea_dutch_f3/process_f3_data/windowed_data/all"
   parser.add_argument("--data-dir", type=str, default=path)
+  parser.add_argument(
+      "--stream",
+      action='store_true',
+      default=False,
+      help=("Copy the binary files in blocks and only write new headers "
+            "instead of reading every file into memory"),
+  )
+  parser.add_argument(
+      "--block-mb",
+      type=int,
+      default=64,
+      help="Size of the copied blocks with --stream [MB]",
+  )
+  parser.add_argument(
+      "--workers",
+      type=int,
+      default=1,
+      help="Number of outputs combined in parallel with --stream",
+  )
   return parser
 
 
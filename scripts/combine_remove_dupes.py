@@ -4,21 +4,24 @@ import numpy as np
 from tqdm import tqdm
 
 from regio import seppy
+from utils import KeyIndex
+from sep_io import (read_axes, read_header_pars, sep_binary, write_header,
+                    copy_bytes)
+from shot_dataset import rank_suffixes
+from shot_reader import trace_ranges
 
+KEYS = ('f3_shots', 'f3_srcx', 'f3_srcy', 'f3_recx', 'f3_recy', 'f3_nrec',
+        'f3_strm')
 
-def _find_duplicates(all_srcx, all_srcy):
-  scoords = np.zeros([len(all_srcx), 2], dtype='float32')
-  scoords[:, 0], scoords[:, 1] = all_srcx, all_srcy
-
-  uscoords, idx = np.unique(scoords, axis=0, return_index=True)
 
-  # Compute mask to get indices of duplicates
-  m = np.zeros(len(all_srcx), dtype=bool)
-  m[idx] = True
+def _find_duplicates(all_srcx, all_srcy):
+  """ Returns a mask [nshots] of the first shot at each source location """
+  return KeyIndex(all_srcy, all_srcx).first()
 
-  dupes = scoords[~m].tolist()
 
-  return {'(%d, %d)' % (icrd[0], icrd[1]): 0 for icrd in dupes}
+def _trace_mask(keep, nrec):
+  """ Expands a mask [nshots] of kept shots to a mask [ntr] of their traces """
+  return np.repeat(keep, np.asarray(nrec, dtype='int64'))
 
 
 def _read_data(data_dir, suffix, bases, sep):
@@ -35,18 +38,66 @@ def _read_data(data_dir, suffix, bases, sep):
   return odict
 
 
+def _copy_ranges(src, dst, ranges, n1, block):
+  """
+  Copies ranges of the slowest axis of a SEP file to a new SEP file
+
+  Parameters:
+    src    - input SEP header file (must be xdr_float)
+    dst    - output SEP header file (binary written to dst@)
+    ranges - [beg, end) ranges [nrange, 2] to copy along the slowest axis
+    n1     - number of samples per element of the slowest axis
+    block  - size of each copied block in bytes
+  """
+  pars = read_header_pars(src)
+  if pars.get('data_format', 'xdr_float') != 'xdr_float':
+    raise ValueError("Streaming requires xdr_float data, %s is %s" %
+                     (src, pars['data_format']))
+  nbytes = 4 * n1
+  with open(sep_binary(src), 'rb') as fsrc, open(dst + '@', 'wb') as fdst:
+    for beg, end in ranges:
+      copy_bytes(fsrc, fdst, (end - beg) * nbytes, block, beg * nbytes)
+  _, o, d = read_axes(src)
+  n = [n1, int(np.sum(ranges[:, 1] - ranges[:, 0]))]
+  if n1 == 1:
+    n, o, d = n[1:], o[:1], d[:1]
+  else:
+    o, d = o + [0.0] * (2 - len(o)), d + [1.0] * (2 - len(d))
+  write_header(dst, n, o, d, dst + '@')
+
+
+def _stream_suffix(args, suffix, keep):
+  """
+  Writes the kept shots of one rank by copying their byte ranges
+
+  Parameters:
+    args   - command line arguments
+    suffix - suffix of the per-rank files
+    keep   - mask [nshots] of the shots of this rank to keep
+  """
+  block = args.block_mb * 2**20
+  inames = {key: os.path.join(args.data_dir, key) + suffix for key in KEYS}
+  onames = {
+      key: os.path.join(args.output_dir, key) + args.output_prefix + suffix
+      for key in KEYS
+  }
+  # Ranges of kept shots and of their traces
+  srngs = trace_ranges(np.flatnonzero(keep))
+  _, nrec = seppy.sep().read_file(inames['f3_nrec'])
+  trngs = trace_ranges(np.flatnonzero(_trace_mask(keep, nrec)))
+  for key in ['f3_srcx', 'f3_srcy', 'f3_nrec']:
+    _copy_ranges(inames[key], onames[key], srngs, 1, block)
+  for key in ['f3_recx', 'f3_recy']:
+    _copy_ranges(inames[key], onames[key], trngs, 1, block)
+  nt = read_axes(inames['f3_shots'])[0][0]
+  _copy_ranges(inames['f3_shots'], onames['f3_shots'], trngs, nt, block)
+
+
 def main(args):
-  suffixes = sorted([
-      ifile.split('f3_shots')[-1]
-      for ifile in os.listdir(args.data_dir)
-      if 'f3_shots' in ifile
-  ])
+  suffixes = rank_suffixes(args.data_dir)
 
   sep = seppy.sep()
-  keys = [
-      'f3_shots', 'f3_srcx', 'f3_srcy', 'f3_recx', 'f3_recy', 'f3_nrec',
-      'f3_strm'
-  ]
+  keys = list(KEYS)
 
   # Load in all of the source coordinates
   all_srcx, all_srcy = [], []
@@ -57,48 +108,37 @@ def main(args):
     _, srcy = sep.read_file(srcy_base + suffix)
     all_srcx.append(srcx)
     all_srcy.append(srcy)
+  nshots = [len(srcx) for srcx in all_srcx]
 
   # Find all duplicate coordinates
   all_srcx = np.concatenate(all_srcx, axis=0)
   all_srcy = np.concatenate(all_srcy, axis=0)
-  dup_dict = _find_duplicates(all_srcx, all_srcy)
-
-  # Loop over all data
-  ddict = {key: [] for key in keys}
-  for k, suffix in tqdm(enumerate(suffixes), desc='rank', total=len(suffixes)):
+  keep = _find_duplicates(all_srcx, all_srcy)
+
+  if args.stream:
+    # Copy the kept shots of each rank without loading its data
+    ishot = 0
+    for suffix, nshot in tqdm(zip(suffixes, nshots),
+                              desc='rank',
+                              total=len(suffixes)):
+      _stream_suffix(args, suffix, keep[ishot:ishot + nshot])
+      ishot += nshot
+    return
+
+  # Select the kept shots and traces of each rank
+  ishot = 0
+  for suffix, nshot in tqdm(zip(suffixes, nshots),
+                            desc='rank',
+                            total=len(suffixes)):
     alldat = _read_data(args.data_dir, suffix, keys, sep)
-
-    ctr = 0
-    odict = {key: [] for key in keys}
-    srcxs, srcys = alldat['f3_srcx'].tolist(), alldat['f3_srcy'].tolist()
-    for k, (sidx, sidy) in enumerate(zip(srcxs, srcys)):
-      crd = '(%d, %d)' % (sidx, sidy)
-      if crd in dup_dict.keys():
-        if dup_dict[crd] == 0:
-          nrec = alldat['f3_nrec'][k]
-          odict['f3_srcx'].append(alldat['f3_srcx'][k])
-          odict['f3_srcy'].append(alldat['f3_srcy'][k])
-          odict['f3_nrec'].append(nrec)
-          odict['f3_shots'].append(alldat['f3_shots'][ctr:ctr + nrec])
-          odict['f3_recx'].append(alldat['f3_recx'][ctr:ctr + nrec])
-          odict['f3_recy'].append(alldat['f3_recy'][ctr:ctr + nrec])
-          dup_dict[crd] += 1
-        else:
-          ddict['f3_srcx'].append(alldat['f3_srcx'][k])
-          ddict['f3_srcy'].append(alldat['f3_srcy'][k])
-          ddict['f3_nrec'].append(nrec)
-          ddict['f3_shots'].append(alldat['f3_shots'][ctr:ctr + nrec])
-          ddict['f3_recx'].append(alldat['f3_recx'][ctr:ctr + nrec])
-          ddict['f3_recy'].append(alldat['f3_recy'][ctr:ctr + nrec])
-      else:
-        nrec = alldat['f3_nrec'][k]
-        odict['f3_srcx'].append(alldat['f3_srcx'][k])
-        odict['f3_srcy'].append(alldat['f3_srcy'][k])
-        odict['f3_nrec'].append(nrec)
-        odict['f3_shots'].append(alldat['f3_shots'][ctr:ctr + nrec])
-        odict['f3_recx'].append(alldat['f3_recx'][ctr:ctr + nrec])
-        odict['f3_recy'].append(alldat['f3_recy'][ctr:ctr + nrec])
-      ctr += alldat['f3_nrec'][k]
+    skeep = keep[ishot:ishot + nshot]
+    tkeep = _trace_mask(skeep, alldat['f3_nrec'])
+    odict = {}
+    for key in ['f3_srcx', 'f3_srcy', 'f3_nrec']:
+      odict[key] = alldat[key][skeep]
+    for key in ['f3_shots', 'f3_recx', 'f3_recy']:
+      odict[key] = alldat[key][tkeep]
+    ishot += nshot
 
     # Srcx coordinates
     usrcx = np.asarray(odict['f3_srcx'], dtype='float32')
@@ -113,15 +153,15 @@ def main(args):
     name = os.path.join(args.output_dir, 'f3_nrec') + args.output_prefix + suffix
     sep.write_file(name, unrec)
     # Shots
-    udata = np.concatenate(odict['f3_shots'], axis=0)
+    udata = odict['f3_shots']
     name = os.path.join(args.output_dir, 'f3_shots') + args.output_prefix + suffix
     sep.write_file(name, udata.T, ds=[0.002, 1.0], os=[0.0, 0.0])
     # Recx coordinates
-    urecx = np.concatenate(odict['f3_recx'], axis=0)
+    urecx = odict['f3_recx']
     name = os.path.join(args.output_dir, 'f3_recx') + args.output_prefix + suffix
     sep.write_file(name, urecx)
     # Recy coordinates
-    urecy = np.concatenate(odict['f3_recy'], axis=0)
+    urecy = odict['f3_recy']
     name = os.path.join(args.output_dir, 'f3_recy') + args.output_prefix + suffix
     sep.write_file(name, urecy)
 
@@ -130,6 +170,19 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument("--data-dir", type=str, default=None)
   parser.add_argument("--output-prefix", type=str, default='_clean')
   parser.add_argument("--output-dir", type=str, default=None)
+  parser.add_argument(
+      "--stream",
+      action='store_true',
+      default=False,
+      help=("Copy the byte ranges of the kept shots of each rank in blocks "
+            "instead of loading the rank files"),
+  )
+  parser.add_argument(
+      "--block-mb",
+      type=int,
+      default=64,
+      help="Size of the copied blocks with --stream [MB]",
+  )
   return parser
 
 
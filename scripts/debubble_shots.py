@@ -7,6 +7,35 @@ from adf.stat.pef1d import gapped_pef
 from adf.stat.conv1dm import conv1dm
 
 
+def debubble(data, lags, invflt, out=None, verb=False) -> np.ndarray:
+  """
+  Applies an inverse (debubble) filter to every trace
+
+  Parameters:
+    data   - input traces [ntr,nt]
+    lags   - lags of the filter coefficients
+    invflt - filter coefficients
+    out    - output array [ntr,nt] (must not be data) [None]
+    verb   - show a progress bar [False]
+
+  Returns the filtered traces (out if given)
+  """
+  ntr, nt = data.shape
+  if out is None:
+    out = np.zeros(data.shape, dtype='float32')
+  cop = conv1dm(nt, len(lags), lags, flt=invflt)
+  for itr in tqdm(range(ntr), desc="ntr", disable=(not verb)):
+    cop.forward(False, data[itr], out[itr])
+  return out
+
+
+def read_filter(sep, input_filter, input_lags):
+  """ Reads a debubble filter and its lags """
+  _, invflt = sep.read_file(input_filter)
+  _, lags = sep.read_file(input_lags)
+  return lags.astype('int32'), invflt
+
+
 def main(args):
   sep = seppy.sep()
   daxes, data = sep.read_file(args.input_data)
@@ -16,9 +45,7 @@ def main(args):
   dt, _ = daxes.d
 
   if args.input_filter is not None:
-    faxes, invflt = sep.read_file(args.input_filter)
-    laxes, lags = sep.read_file(args.input_lags)
-    lags = lags.astype('int32')
+    lags, invflt = read_filter(sep, args.input_filter, args.input_lags)
   else:
     lags, invflt = gapped_pef(
         data[args.trace_idx],
@@ -28,11 +55,7 @@ def main(args):
         verb=args.verb,
     )
 
-  cop = conv1dm(nt, len(lags), lags, flt=invflt)
-
-  deb = np.zeros(data.shape, dtype='float32')
-  for itr in tqdm(range(ntr), desc="ntr", disable=(not args.verb)):
-    cop.forward(False, data[itr], deb[itr])
+  deb = debubble(data, lags, invflt, verb=args.verb)
 
   sep.write_file(args.output_data, deb.T, os=daxes.o, ds=daxes.d)
 
@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+
+from sep_io import sep_binary
+
+
+def file_digest(fname, cache=None, block=16 * 2**20) -> str:
+  """
+  Computes the SHA-256 digest of the contents of a file
+
+  The digest is only recomputed if the size or modification time of the
+  file differ from the ones recorded in the cache
+
+  Parameters:
+    fname - path to the file
+    cache - dictionary of [size, mtime_ns, digest] of each path (updated) [None]
+    block - size of the blocks read [16 MB]
+  """
+  fname = os.path.abspath(fname)
+  st = os.stat(fname)
+  if cache is not None:
+    entry = cache.get(fname)
+    if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+      return entry[2]
+  sha = hashlib.sha256()
+  with open(fname, 'rb') as f:
+    buf = f.read(block)
+    while len(buf) > 0:
+      sha.update(buf)
+      buf = f.read(block)
+  digest = sha.hexdigest()
+  if cache is not None:
+    cache[fname] = [st.st_size, st.st_mtime_ns, digest]
+  return digest
+
+
+def sep_digests(name, fname, cache=None) -> dict:
+  """
+  Returns the digests of the header (name) and of the binary (name@) of a
+  SEP file
+  """
+  return {
+      name: file_digest(fname, cache),
+      name + '@': file_digest(sep_binary(fname), cache),
+  }
+
+
+def fingerprint(digests, params) -> str:
+  """
+  Combines file digests and parameters into a single fingerprint
+
+  Parameters:
+    digests - dictionary of the digest of each file by name (the names are
+              part of the fingerprint, not the paths)
+    params  - JSON serializable parameters
+  """
+  sha = hashlib.sha256()
+  for name in sorted(digests):
+    sha.update(('%s=%s\n' % (name, digests[name])).encode())
+  sha.update(json.dumps(params, sort_keys=True).encode())
+  return sha.hexdigest()
+
+
+def read_fingerprint(fname):
+  """ Reads a fingerprint file. Returns None if it does not exist """
+  if not os.path.exists(fname):
+    return None
+  with open(fname, 'r') as f:
+    return json.load(f)
+
+
+def write_fingerprint(fname, fdict):
+  """ Writes a fingerprint file atomically """
+  tmp = fname + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(fdict, f)
+  os.replace(tmp, fname)
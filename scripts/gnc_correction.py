@@ -5,25 +5,40 @@ import matplotlib.pyplot as plt
 from regio import seppy
 
 
-def main(args):
-  sep = seppy.sep()
-  daxes, data = sep.read_file(args.input_data)
-  data = data.reshape(daxes.n, order='F').T
-  data = np.ascontiguousarray(data).astype('float32')
-  ntr, nt = data.shape
-  dt, _ = daxes.d
+def gnc_correct(
+    data,
+    dt,
+    time_shift=0.008,
+    max_time=6.0,
+    energy_level=-1.0,
+    energy_qc=False,
+) -> np.ndarray:
+  """
+  Shifts the traces in time, windows them and replaces noisy traces
+
+  Parameters:
+    data         - input traces [ntr,nt]
+    dt           - temporal sampling interval
+    time_shift   - time shift applied to the traces [0.008s]
+    max_time     - maximum time of the output [6s]
+    energy_level - replace the traces above this energy with the previous
+                   trace (disabled if <= 0) [-1]
+    energy_qc    - plot the energy of the traces [False]
 
-  samples = int(args.time_shift / dt)
+  Returns the corrected traces [ntr,max_time/dt]
+  """
+  ntr = data.shape[0]
+  samples = int(time_shift / dt)
   data_pad = np.pad(data, ((0, 0), (0, samples)))
 
   data_shift = np.roll(data_pad, samples, axis=1)
 
   # Window to max time
-  max_samples = int(args.max_time / dt)
+  max_samples = int(max_time / dt)
   data_shift = data_shift[:, :max_samples]
 
   trace_energy = np.sum(data_shift * data_shift, axis=1)
-  if args.energy_qc:
+  if energy_qc:
     fig = plt.figure()
     ax = fig.gca()
     ax.plot(trace_energy)
@@ -32,8 +47,8 @@ def main(args):
     plt.show()
 
   # Compute energy over time axis
-  if args.energy_level > 0:
-    idx = trace_energy > args.energy_level
+  if energy_level > 0:
+    idx = trace_energy > energy_level
     if np.sum(idx) > 100:
       print(
           "WARNING: energy threshold is probably too low. Cleaning up %d traces"
@@ -42,6 +57,25 @@ def main(args):
       if idx[itr]:
         data_shift[itr] = data_shift[itr - 1]
 
+  return data_shift
+
+
+def main(args):
+  sep = seppy.sep()
+  daxes, data = sep.read_file(args.input_data)
+  data = data.reshape(daxes.n, order='F').T
+  data = np.ascontiguousarray(data).astype('float32')
+  dt, _ = daxes.d
+
+  data_shift = gnc_correct(
+      data,
+      dt,
+      time_shift=args.time_shift,
+      max_time=args.max_time,
+      energy_level=args.energy_level,
+      energy_qc=args.energy_qc,
+  )
+
   sep.write_file(args.output_data, data_shift.T, os=daxes.o, ds=daxes.d)
 
 
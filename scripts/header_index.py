@@ -0,0 +1,240 @@
+import os
+import segyio
+import numpy as np
+
+from utils import pack_coords
+
+# Trace header columns kept for each SEG-Y file
+HDR_DTYPE = np.dtype([
+    ('srcy', 'int32'),
+    ('srcx', 'int32'),
+    ('recy', 'int32'),
+    ('recx', 'int32'),
+    ('strm', 'int32'),
+    ('tid', 'int32'),
+])
+
+# Global table of indexed files. The offset is the global index
+# of the first trace of the file within the survey. The data offset,
+# number of samples and sample format locate the traces within the file
+TABLE_DTYPE = np.dtype([
+    ('path', 'U512'),
+    ('ntr', 'int64'),
+    ('offset', 'int64'),
+    ('data_offset', 'int64'),
+    ('ns', 'int32'),
+    ('format', 'int32'),
+])
+
+# Size of the textual and binary file headers of a SEG-Y file
+TEXT_HDR_SIZE, BIN_HDR_SIZE = 3200, 400
+
+TABLE_NAME = 'table.npy'
+
+# Trace identification code of dead traces
+DEAD_TID = 2
+
+# Number of traces and of live traces recorded by each source
+# (key is the packed source coordinate, see utils.pack_coords)
+SRC_STATS_DTYPE = np.dtype([
+    ('key', 'int64'),
+    ('ntr', 'int64'),
+    ('nlive', 'int64'),
+])
+
+SRC_STATS_NAME = 'src_stats.npy'
+
+
+def read_headers(sgy) -> np.ndarray:
+  """
+  Reads the trace headers needed for data selection from an open SEG-Y file
+
+  Parameters:
+    sgy - a SEG-Y file opened with segyio
+
+  Returns a structured array [ntr] with HDR_DTYPE fields
+  """
+  fields = {
+      'srcy': segyio.TraceField.SourceY,
+      'srcx': segyio.TraceField.SourceX,
+      'recy': segyio.TraceField.GroupY,
+      'recx': segyio.TraceField.GroupX,
+      'strm': segyio.TraceField.CDP_TRACE,
+      'tid': segyio.TraceField.TraceIdentificationCode,
+  }
+  hdrs = np.zeros(sgy.tracecount, dtype=HDR_DTYPE)
+  for name, field in fields.items():
+    hdrs[name] = sgy.attributes(field)[:]
+  return hdrs
+
+
+def index_file_name(index_dir, segy):
+  """ Returns the name of the header index file of a SEG-Y file """
+  return os.path.join(
+      index_dir,
+      os.path.splitext(os.path.basename(segy))[0] + '.npy',
+  )
+
+
+def index_segy(segy, index_dir):
+  """
+  Reads the trace headers of a SEG-Y file and writes its header index file
+
+  Parameters:
+    segy      - path to the SEG-Y file
+    index_dir - output directory of the header index
+
+  Returns the trace headers [ntr] and the file table entry of the file
+  (without its global trace offset)
+  """
+  with segyio.open(segy, ignore_geometry=True) as sgy:
+    hdrs = read_headers(sgy)
+    data_offset = TEXT_HDR_SIZE * (1 + sgy.ext_headers) + BIN_HDR_SIZE
+    ns, fmt = len(sgy.samples), int(sgy.format)
+  np.save(index_file_name(index_dir, segy), hdrs)
+  return hdrs, {
+      'path': segy,
+      'ntr': len(hdrs),
+      'data_offset': data_offset,
+      'ns': ns,
+      'format': fmt,
+  }
+
+
+def write_table(index_dir, rows):
+  """
+  Writes the global file table of a header index
+
+  Parameters:
+    index_dir - output directory of the header index
+    rows      - file table entries returned by index_segy (in survey order)
+  """
+  table = np.zeros(len(rows), dtype=TABLE_DTYPE)
+  for name in ['path', 'ntr', 'data_offset', 'ns', 'format']:
+    table[name] = [row[name] for row in rows]
+  table['offset'][1:] = np.cumsum(table['ntr'])[:-1]
+  np.save(os.path.join(index_dir, TABLE_NAME), table)
+
+
+def source_stats(hdrs) -> np.ndarray:
+  """
+  Counts the traces and the live traces of each source in a SEG-Y file
+
+  Parameters:
+    hdrs - trace headers [ntr] of the file
+
+  Returns a structured array [nsrc] with SRC_STATS_DTYPE fields
+  """
+  keys, inv = np.unique(pack_coords(hdrs['srcy'], hdrs['srcx']),
+                        return_inverse=True)
+  stats = np.zeros(len(keys), dtype=SRC_STATS_DTYPE)
+  stats['key'] = keys
+  stats['ntr'] = np.bincount(inv, minlength=len(keys))
+  stats['nlive'] = np.bincount(inv,
+                               weights=hdrs['tid'] != DEAD_TID,
+                               minlength=len(keys))
+  return stats
+
+
+def write_source_stats(index_dir, stats):
+  """
+  Merges the source statistics of all files and writes them to the index
+
+  Parameters:
+    index_dir - output directory of the header index
+    stats     - source statistics of each file returned by source_stats
+  """
+  stats = np.concatenate(stats) if len(stats) > 0 else np.zeros(
+      0, dtype=SRC_STATS_DTYPE)
+  keys, inv = np.unique(stats['key'], return_inverse=True)
+  merged = np.zeros(len(keys), dtype=SRC_STATS_DTYPE)
+  merged['key'] = keys
+  merged['ntr'] = np.bincount(inv, weights=stats['ntr'], minlength=len(keys))
+  merged['nlive'] = np.bincount(inv,
+                                weights=stats['nlive'],
+                                minlength=len(keys))
+  np.save(os.path.join(index_dir, SRC_STATS_NAME), merged)
+
+
+def write_header_index(segys, index_dir, progress=None):
+  """
+  Reads the trace headers of each SEG-Y file once and writes them
+  to a per-file header index along with the global file table
+
+  Parameters:
+    segys     - list of paths to SEG-Y files
+    index_dir - output directory of the header index
+    progress  - optional wrapper for the file iterator (e.g., tqdm)
+  """
+  if not os.path.isdir(index_dir):
+    os.mkdir(index_dir)
+  segyiter = segys if progress is None else progress(segys)
+  rows, stats = [], []
+  for segy in segyiter:
+    hdrs, row = index_segy(segy, index_dir)
+    rows.append(row)
+    stats.append(source_stats(hdrs))
+  write_table(index_dir, rows)
+  write_source_stats(index_dir, stats)
+
+
+class HeaderIndex:
+  """ Read-only access to a header index written by write_header_index """
+
+  def __init__(self, index_dir):
+    """
+    HeaderIndex constructor
+
+    Parameters:
+      index_dir - directory containing the header index
+    """
+    self.index_dir = index_dir
+    self.table = np.load(os.path.join(index_dir, TABLE_NAME))
+    self.__rows = {
+        os.path.basename(path): k for k, path in enumerate(self.table['path'])
+    }
+    # Older indexes do not have source statistics
+    stats_file = os.path.join(index_dir, SRC_STATS_NAME)
+    self.src_stats = np.load(stats_file) if os.path.exists(stats_file) else None
+
+  def __contains__(self, segy):
+    return os.path.basename(segy) in self.__rows
+
+  def __len__(self):
+    return len(self.table)
+
+  def read(self, segy) -> np.ndarray:
+    """
+    Reads the trace headers [ntr] of a SEG-Y file into memory
+
+    Not cached (ShotReader caches the headers of the open files)
+    """
+    if segy not in self:
+      raise KeyError("%s is not in the header index %s" %
+                     (segy, self.index_dir))
+    return np.load(index_file_name(self.index_dir, segy))
+
+  def row(self, segy) -> np.void:
+    """ Returns the entry of a SEG-Y file in the file table """
+    return self.table[self.__rows[os.path.basename(segy)]]
+
+  def dead_mask(self, srcy, srcx) -> np.ndarray:
+    """
+    Flags the sources whose traces are all dead
+
+    Sources missing from the index (or all sources if the index has no
+    source statistics) are not flagged
+
+    Parameters:
+      srcy - y source coordinates
+      srcx - x source coordinates
+
+    Returns a boolean mask with the shape of srcy
+    """
+    keys = pack_coords(srcy, srcx)
+    if self.src_stats is None or len(self.src_stats) == 0:
+      return np.zeros(keys.shape, dtype=bool)
+    pos = np.minimum(np.searchsorted(self.src_stats['key'], keys),
+                     len(self.src_stats) - 1)
+    found = self.src_stats['key'][pos] == keys
+    return found & (self.src_stats['nlive'][pos] == 0)
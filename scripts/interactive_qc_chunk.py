@@ -9,7 +9,7 @@ from sivu.movie import qc_f3data
 
 def main(args):
   files = os.listdir(args.chunk_dir)
-  files = list(filter(lambda f: '.H' in f, files))
+  files = list(filter(lambda f: f.endswith('.H'), files))
 
   keys = [
       'f3_shots', 'f3_srcx', 'f3_recx', 'f3_srcy', 'f3_recy', 'f3_nrec',
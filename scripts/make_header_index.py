@@ -0,0 +1,38 @@
+import os
+import argparse
+from tqdm import tqdm
+
+from header_index import write_header_index
+
+
+def main(args):
+  segys = sorted([
+      os.path.join(args.segy, isegy)
+      for isegy in os.listdir(args.segy)
+      if '.segy' in isegy
+  ])
+
+  write_header_index(
+      segys,
+      args.output_index_dir,
+      progress=lambda files: tqdm(files, desc='nsegy'),
+  )
+
+
+def attach_args(parser=argparse.ArgumentParser()):
+  parser.add_argument(
+      "--segy",
+      type=str,
+      default="/net/brick5/data3/northsea_dutch_f3/segy",
+      help="Path to segy files",
+  )
+  parser.add_argument(
+      "--output-index-dir",
+      type=str,
+      default="/net/brick5/data3/northsea_dutch_f3/segy/info_new/hdr_index",
+  )
+  return parser
+
+
+if __name__ == "__main__":
+  main(attach_args().parse_args())
@@ -3,6 +3,14 @@ import argparse
 import numpy as np
 from tqdm import tqdm
 
+from utils import pmap
+from src_map import write_source_map
+
+
+def _read_srcinfo_file(ifile) -> np.ndarray:
+  """ Reads the source coordinates and counts [nsrc,3] of an info file """
+  return np.loadtxt(ifile, dtype='int64', ndmin=2).reshape(-1, 3)
+
 
 def main(args):
   files = sorted([
@@ -11,34 +19,35 @@ def main(args):
       if '.txt' in ifile
   ])
 
-  odict, srcx, srcy = {}, [], []
-  for ifile in tqdm(files, desc='files'):
-    # Read in in the file
-    with open(ifile, 'r') as f:
-      scoords = f.readlines()
+  # Parse the info files (concurrently if workers > 1) in file order
+  sfiles, srcy, srcx, fileids = [], [], [], []
+  for k, (ifile, scoords) in enumerate(
+      tqdm(
+          zip(files, pmap(_read_srcinfo_file, files, args.workers)),
+          desc='files',
+          total=len(files),
+      )):
     # Change the file extension to SEGY
-    sfile = os.path.join(
-        args.segy,
-        os.path.splitext(os.path.basename(ifile))[0] + '.segy',
-    )
-    for icrd in scoords:
-      key = icrd.rstrip()[:14]
-      srcx.append(int(key[:7]))
-      srcy.append(int(key[8:]))
-      if (key not in odict.keys()):
-        odict[key] = [sfile]
-      else:
-        odict[key].append(sfile)
+    sfiles.append(
+        os.path.join(
+            args.segy,
+            os.path.splitext(os.path.basename(ifile))[0] + '.segy',
+        ))
+    srcy.append(scoords[:, 0])
+    srcx.append(scoords[:, 1])
+    fileids.append(np.full(len(scoords), k, dtype='int32'))
+
+  srcy = np.concatenate(srcy)
+  srcx = np.concatenate(srcx)
+  fileids = np.concatenate(fileids)
+  write_source_map(args.output_hmap, srcy, srcx, fileids, sfiles)
 
   # Get unique source coordinates
-  srcx = np.asarray(srcx)
-  srcy = np.asarray(srcy)
   srcs = np.zeros([len(srcx), 2])
-  srcs[:, 0] = srcx
-  srcs[:, 1] = srcy
+  srcs[:, 0] = srcy
+  srcs[:, 1] = srcx
   usrcs = np.unique(srcs, axis=0)
 
-  np.save(args.output_hmap, odict)
   np.save(args.output_scoords, usrcs)
 
 
@@ -57,13 +66,19 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument(
       "--output-hmap",
       type=str,
-      default="/net/brick5/data3/northsea_dutch_f3/segy/info_new/src_hmap.npy",
+      default="/net/brick5/data3/northsea_dutch_f3/segy/info_new/src_hmap",
   )
   parser.add_argument(
       "--output-scoords",
       type=str,
       default="/net/brick5/data3/northsea_dutch_f3/segy/info_new/scoords.npy",
   )
+  parser.add_argument(
+      "--workers",
+      type=int,
+      default=1,
+      help="Number of processes parsing info files concurrently",
+  )
   return parser
 
 
@@ -5,91 +5,181 @@ from tqdm import tqdm
 
 from regio import seppy
 from adf.gradopt.utils import create_inttag
+from shot_dataset import ShotDataset
+from utils import pmap
 
 
-def main(args):
-  sep = seppy.sep()
+class _CombinedShots:
+  """ Reads windows of shots from the combined (all ranks) SEP files """
+
+  def __init__(self, args, sep):
+    # First read in srcx, srcy, nrec
+    _, self.srcx = sep.read_file(args.all_srcx)
+    _, self.srcy = sep.read_file(args.all_srcy)
+    _, self.nrec = sep.read_file(args.all_nrec)
+    self.nrec = self.nrec.astype('int32')
+
+    _, self.recx = sep.read_file(args.all_recx)
+    _, self.recy = sep.read_file(args.all_recy)
+    _, self.strm = sep.read_file(args.all_strm)
+    self.all_shots = args.all_shots
+    self.sep = sep
 
-  # First read in srcx, srcy, nrec
-  _, all_srcx = sep.read_file(args.all_srcx)
-  _, all_srcy = sep.read_file(args.all_srcy)
-  _, all_nrec = sep.read_file(args.all_nrec)
-  all_nrec = all_nrec.astype('int32')
-
-  _, all_recx = sep.read_file(args.all_recx)
-  _, all_recy = sep.read_file(args.all_recy)
-  _, all_strm = sep.read_file(args.all_strm)
-
-  total_shots = len(all_srcx)
-  nchunks = int(total_shots / args.chunk_size + 0.5)
-
-  begsht, endsht = 0, args.chunk_size
-  begtr, endtr = 0, 0
-  for ichunk in tqdm(range(nchunks), desc='nchunks'):
-    # Window the headers
-    srcx_chunk = all_srcx[begsht:endsht]
-    srcy_chunk = all_srcy[begsht:endsht]
-    nrec_chunk = all_nrec[begsht:endsht]
-    endtr += np.sum(nrec_chunk)
-    recx_chunk = all_recx[begtr:endtr]
-    recy_chunk = all_recy[begtr:endtr]
-    strm_chunk = all_strm[begtr:endtr]
-    # Read in a data chunk
-    daxes, dat = sep.read_wind(args.all_shots, fw=begtr, nw=len(recx_chunk))
+  def __len__(self):
+    return len(self.srcx)
+
+  def read_shots(self, begsht, endsht, begtr, endtr):
+    """ Returns the headers, axes (o, d) and data [nt,ntr] of a shot range """
+    daxes, dat = self.sep.read_wind(self.all_shots, fw=begtr, nw=endtr - begtr)
     dat = dat.reshape(daxes.n, order='F')
-    # Write chunks to file
-    tag = create_inttag(ichunk, nchunks)
-    chunk_dir = os.path.join(args.output_dir, 'chunk_' + tag)
-    if not os.path.isdir(chunk_dir):
-      os.mkdir(chunk_dir)
-    if not args.to_npy:
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_srcx_' + args.string_id + tag + '.H'),
-          srcx_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_srcy_' + args.string_id + tag + '.H'),
-          srcy_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_nrec_' + args.string_id + tag + '.H'),
-          nrec_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_recx_' + args.string_id + tag + '.H'),
-          recx_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_recy_' + args.string_id + tag + '.H'),
-          recy_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_strm_' + args.string_id + tag + '.H'),
-          strm_chunk.astype('float32'),
-      )
-      sep.write_file(
-          os.path.join(chunk_dir, 'f3_shots_' + args.string_id + tag + '.H'),
-          dat.astype('float32'),
-          os=daxes.o,
-          ds=daxes.d,
-      )
-    else:
-      odict = {}
-      odict['dt'] = daxes.d[0]
-      odict['f3_shots'] = np.ascontiguousarray(dat.T).astype('float32')
-      odict['f3_nrec'] = nrec_chunk.astype('int32')
-      odict['f3_srcx'] = srcx_chunk.astype('float32')
-      odict['f3_srcy'] = srcy_chunk.astype('float32')
-      odict['f3_recx'] = recx_chunk.astype('float32')
-      odict['f3_recy'] = recy_chunk.astype('float32')
-      np.save(
-          os.path.join(chunk_dir, 'chunk_' + args.string_id + tag + '.npy'),
-          odict,
-      )
-    # Update counters
-    begsht = endsht
-    endsht += args.chunk_size
-    begtr = endtr
+    return {
+        'f3_srcx': self.srcx[begsht:endsht],
+        'f3_srcy': self.srcy[begsht:endsht],
+        'f3_nrec': self.nrec[begsht:endsht],
+        'f3_recx': self.recx[begtr:endtr],
+        'f3_recy': self.recy[begtr:endtr],
+        'f3_strm': self.strm[begtr:endtr],
+    }, daxes.o, daxes.d, dat
+
+
+class _RankShots:
+  """
+  Reads windows of shots directly from the per-rank SEP files
+
+  The per-rank shots are not interpolated, so this only replaces a
+  combined shots file made by combine_ranks.py without interpolation
+  (f3_shots_all_combined.H), not the default f3_shots_all_combined_interp.H
+  """
+
+  def __init__(self, args, sep):
+    self.dset = ShotDataset(args.rank_dir, sep)
+    self.nrec = self.dset.nrec
+
+  def __len__(self):
+    return len(self.dset)
+
+  def read_shots(self, begsht, endsht, begtr, endtr):
+    """ Returns the headers, axes (o, d) and data [nt,ntr] of a shot range """
+    odict = self.dset.read_shots(begsht, endsht)
+    dat = odict.pop('f3_shots').T
+    return odict, self.dset.o, self.dset.d, dat
+
+
+# Shots read by the chunk writers (inherited by forked workers)
+_SHOTS = None
+
+
+def _open_shots(args):
+  """ Opens the per-rank files or the combined files """
+  sep = seppy.sep()
+  if args.rank_dir:
+    return _RankShots(args, sep)
+  return _CombinedShots(args, sep)
+
+
+def chunk_bounds(nrec, chunk_size):
+  """
+  Computes the shot and trace ranges of each chunk
+
+  Parameters:
+    nrec       - number of traces of each shot [nshots]
+    chunk_size - number of shots per chunk
+
+  Returns an array [nchunks, 4] of the (begsht, endsht, begtr, endtr)
+  of each chunk
+  """
+  total_shots = len(nrec)
+  nchunks = int(total_shots / chunk_size + 0.5)
+  first = np.zeros(total_shots + 1, dtype='int64')
+  np.cumsum(np.asarray(nrec, dtype='int64'), out=first[1:])
+  begsht = np.arange(nchunks, dtype='int64') * chunk_size
+  endsht = begsht + chunk_size
+  begtr = first[np.minimum(begsht, total_shots)]
+  endtr = first[np.minimum(endsht, total_shots)]
+  return np.stack([begsht, endsht, begtr, endtr], axis=1)
+
+
+def _write_chunk(task):
+  """ Reads the shots of a chunk and writes them to its directory """
+  global _SHOTS
+  args, ichunk, nchunks, (begsht, endsht, begtr, endtr) = task
+  if _SHOTS is None:
+    _SHOTS = _open_shots(args)
+  sep = seppy.sep()
+  # Read in the headers and a data chunk
+  hdrs, os_, ds, dat = _SHOTS.read_shots(begsht, endsht, begtr, endtr)
+  srcx_chunk, srcy_chunk = hdrs['f3_srcx'], hdrs['f3_srcy']
+  nrec_chunk = hdrs['f3_nrec']
+  recx_chunk, recy_chunk = hdrs['f3_recx'], hdrs['f3_recy']
+  strm_chunk = hdrs['f3_strm']
+  # Write chunks to file
+  tag = create_inttag(ichunk, nchunks)
+  chunk_dir = os.path.join(args.output_dir, 'chunk_' + tag)
+  if not os.path.isdir(chunk_dir):
+    os.mkdir(chunk_dir)
+  if not args.to_npy:
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_srcx_' + args.string_id + tag + '.H'),
+        srcx_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_srcy_' + args.string_id + tag + '.H'),
+        srcy_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_nrec_' + args.string_id + tag + '.H'),
+        nrec_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_recx_' + args.string_id + tag + '.H'),
+        recx_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_recy_' + args.string_id + tag + '.H'),
+        recy_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_strm_' + args.string_id + tag + '.H'),
+        strm_chunk.astype('float32'),
+    )
+    sep.write_file(
+        os.path.join(chunk_dir, 'f3_shots_' + args.string_id + tag + '.H'),
+        dat.astype('float32'),
+        os=os_,
+        ds=ds,
+    )
+  else:
+    odict = {}
+    odict['dt'] = ds[0]
+    odict['f3_shots'] = np.ascontiguousarray(dat.T).astype('float32')
+    odict['f3_nrec'] = nrec_chunk.astype('int32')
+    odict['f3_srcx'] = srcx_chunk.astype('float32')
+    odict['f3_srcy'] = srcy_chunk.astype('float32')
+    odict['f3_recx'] = recx_chunk.astype('float32')
+    odict['f3_recy'] = recy_chunk.astype('float32')
+    np.save(
+        os.path.join(chunk_dir, 'chunk_' + args.string_id + tag + '.npy'),
+        odict,
+    )
+  return ichunk
+
+
+def main(args):
+  global _SHOTS
+  # Read from the per-rank files or from the combined files
+  if args.rank_dir:
+    print("Reading the non-interpolated shots of %s" % (args.rank_dir))
+  _SHOTS = _open_shots(args)
+
+  bounds = chunk_bounds(_SHOTS.nrec, args.chunk_size)
+  nchunks = len(bounds)
+  tasks = [(args, ichunk, nchunks, tuple(int(b) for b in bounds[ichunk]))
+           for ichunk in range(nchunks)]
+  # Each worker does its own windowed read and writes
+  for _ in tqdm(pmap(_write_chunk, tasks, args.workers),
+                desc='nchunks',
+                total=nchunks):
+    pass
 
 
 def attach_args(parser=argparse.ArgumentParser()):
@@ -129,9 +219,25 @@ def attach_args(parser=argparse.ArgumentParser()):
       type=str,
       default=os.path.join(path, 'all/f3_strm_all_combined.H'),
   )
+  parser.add_argument(
+      "--rank-dir",
+      type=str,
+      default=None,
+      help=("Read the per-rank outputs of select_data_all_parallel.py in "
+            "this directory instead of the --all-* combined files. The "
+            "per-rank shots are NOT interpolated: this only replaces the "
+            "non-interpolated f3_shots_all_combined.H, not the default "
+            "--all-shots (f3_shots_all_combined_interp.H)"),
+  )
   parser.add_argument("--string-id", type=str, default=None)
   parser.add_argument("--to-npy", action='store_true', default=False)
   parser.add_argument("--chunk-size", type=int, default=100)
+  parser.add_argument(
+      "--workers",
+      type=int,
+      default=1,
+      help="Number of processes writing chunks in parallel",
+  )
   parser.add_argument(
       "--output-dir",
       type=str,
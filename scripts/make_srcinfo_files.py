@@ -1,11 +1,43 @@
 import os
 import argparse
+import functools
 import segyio
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 from regio import seppy
+from utils import pmap
+
+
+def write_srcinfo_file(ofile, ucoords, cts):
+  """ Writes the unique (srcy, srcx) coordinates of a file and their counts """
+  with open(ofile, 'w') as f:
+    for icrd in range(ucoords.shape[0]):
+      f.write('%d %d %d\n' % (ucoords[icrd, 0], ucoords[icrd, 1], cts[icrd]))
+
+
+def _scan_segy(segy, output_info_dir):
+  """ Writes the source info file of a SEG-Y file and returns its sources """
+  with segyio.open(segy, ignore_geometry=True) as datsgy:
+    # Get the coordinates
+    srcx = np.asarray(datsgy.attributes(segyio.TraceField.SourceX),
+                      dtype='int32')
+    srcy = np.asarray(datsgy.attributes(segyio.TraceField.SourceY),
+                      dtype='int32')
+  srccoords = np.zeros([len(srcx), 2], dtype='int')
+  srccoords[:, 0] = srcy
+  srccoords[:, 1] = srcx
+
+  ucoords, cts = np.unique(srccoords, axis=0, return_counts=True)
+
+  # Write the unique coordinates to file
+  bname = os.path.basename(segy)
+  fname = os.path.splitext(bname)[0]
+  ofile = os.path.join(output_info_dir, fname + '.txt')
+  write_srcinfo_file(ofile, ucoords, cts)
+
+  return ucoords
 
 
 def main(args):
@@ -29,21 +61,14 @@ def main(args):
     ox = 469800.0
     oy = 6072350.0
 
-  for segy in tqdm(segys, desc="nsegy"):
-    datsgy = segyio.open(segy, ignore_geometry=True)
-
-    # Get the coordinates
-    srcx = np.asarray(datsgy.attributes(segyio.TraceField.SourceX),
-                      dtype='int32')
-    srcy = np.asarray(datsgy.attributes(segyio.TraceField.SourceY),
-                      dtype='int32')
-    srccoords = np.zeros([len(srcx), 2], dtype='int')
-    srccoords[:, 0] = srcy
-    srccoords[:, 1] = srcx
-
-    ucoords, cts = np.unique(srccoords, axis=0, return_counts=True)
-    nsht = ucoords.shape[0]
-
+  # Scan the files (concurrently if workers > 1) in file order
+  scan = functools.partial(
+      _scan_segy,
+      output_info_dir=args.output_info_dir,
+  )
+  for ucoords in tqdm(pmap(scan, segys, args.workers),
+                      desc="nsegy",
+                      total=len(segys)):
     if args.qc:
       # Plot the source coordinates
       fig = plt.figure(figsize=(10, 10))
@@ -59,14 +84,6 @@ def main(args):
       ax.tick_params(labelsize=15)
       plt.show()
 
-    # Loop over unique coordinates and write to file
-    bname = os.path.basename(segy)
-    fname = os.path.splitext(bname)[0]
-    ofile = os.path.join(args.output_info_dir, fname + '.txt')
-    with open(ofile, 'w') as f:
-      for icrd in range(nsht):
-        f.write('%d %d %d\n' % (ucoords[icrd, 0], ucoords[icrd, 1], cts[icrd]))
-
 
 def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument(
@@ -87,6 +104,12 @@ def attach_args(parser=argparse.ArgumentParser()):
       default="/net/brick5/data3/northsea_dutch_f3/mig/mig.T",
   )
   parser.add_argument("--slc-idx", type=int, default=400)
+  parser.add_argument(
+      "--workers",
+      type=int,
+      default=1,
+      help="Number of processes scanning files concurrently",
+  )
   return parser
 
 
@@ -5,6 +5,7 @@ from tqdm import tqdm
 from regio import seppy
 from mdsuops.mute import mute
 from sivu.plot import plot_dat2d
+from mute_ops import mute_streamers, mute_onsets, mute_batch
 
 
 def mute_f3shot(
@@ -20,6 +21,7 @@ def mute_f3shot(
     dt=0.004,
     dx=0.025,
     hyper=True,
+    out=None,
 ) -> np.ndarray:
   """
   Mutes a shot from the F3 dataset
@@ -34,37 +36,94 @@ def mute_f3shot(
     vel   - water velocity [1450.0]
     tp    - length of taper [0.5s]
     dy    - minimum distance between streamers [20 m]
-    dt    - temporal sampling interval [0.002]
+    dt    - temporal sampling interval [0.004]
     dx    - spacing between receivers [25 m]
+    out   - output array [ntr,nt] the muted shot is written to [None]
 
-  Returns a muted shot gather
+  Returns a muted shot gather (out if given)
   """
-  mut = np.zeros(dat.shape, dtype='float32')
-  v0 = vel * 0.001
-  # Find the beginning indices of the streamer
-  idxs = list(np.where(strm[:nrec] == 1)[0])
-  idxs.append(nrec)
-  for istr in range(1, len(idxs)):
-    irecx, irecy = recx[idxs[istr - 1]], recy[idxs[istr - 1]]
-    dist = np.sqrt((isrcx - irecx)**2 + (isrcy - irecy)**2)
-    t0 = dist / vel
-    if (t0 > 0.15):
-      t0 = dist / (vel)
-      v0 = 1.5
-    else:
-      v0 = vel * 0.001
-    mut[idxs[istr - 1]:idxs[istr]] = np.squeeze(
-        mute(
-            dat[idxs[istr - 1]:idxs[istr]],
-            dt=dt,
-            dx=dx,
-            v0=v0,
-            t0=t0,
-            tp=tp,
-            half=False,
-            hyper=hyper,
-        ))
-  return mut
+  return mute_streamers(dat,
+                        isrcx,
+                        isrcy,
+                        nrec,
+                        strm,
+                        recx,
+                        recy,
+                        mute,
+                        tp=tp,
+                        vel=vel,
+                        dt=dt,
+                        dx=dx,
+                        hyper=hyper,
+                        out=out)
+
+
+def mute_shots(
+    data,
+    srcx,
+    srcy,
+    nrec,
+    strm,
+    recx,
+    recy,
+    tp=0.5,
+    vel=1450.0,
+    dt=0.004,
+    engine='mdsuops',
+    out=None,
+) -> np.ndarray:
+  """
+  Mutes a block of F3 shots
+
+  Both engines use the same mute parameters. As in mute_f3shot, dt is the
+  sampling the mute assumes, not necessarily the sampling of the data
+
+  Parameters:
+    data   - input shots [ntr,nt]
+    srcx   - x source coordinates of the shots [nsht]
+    srcy   - y source coordinates of the shots [nsht]
+    nrec   - number of traces of each shot [nsht]
+    strm   - index within the streamer of each trace [ntr]
+    recx   - x receiver coordinates [ntr]
+    recy   - y receiver coordinates [ntr]
+    tp     - length of taper [0.5s]
+    vel    - water velocity [1450.0]
+    dt     - temporal sampling interval of the mute [0.004]
+    engine - 'mdsuops' (per streamer) or 'batched' (numpy) [mdsuops]
+    out    - output array [ntr,nt] (must not be data) [None]
+
+  Returns the muted shots (out if given). Traces after the last shot are
+  zeroed
+  """
+  if out is None:
+    out = np.zeros(data.shape, dtype='float32')
+  nrec = np.asarray(nrec).astype('int32')
+  ntrm = int(np.sum(nrec))
+  out[ntrm:] = 0.0
+  if engine == 'batched':
+    # Mute all shots at once from their per-trace onsets
+    onsets = mute_onsets(srcx, srcy, nrec, strm, recx, recy, vel)
+    mute_batch(data[:ntrm], onsets, dt, tp=tp, out=out[:ntrm])
+    return out
+  ntrw = 0
+  for isht in range(len(nrec)):
+    # Mute only the traces of this shot, in place in the output
+    shtw = slice(ntrw, ntrw + nrec[isht])
+    mute_f3shot(
+        data[shtw],
+        srcx[isht],
+        srcy[isht],
+        nrec[isht],
+        strm[shtw],
+        recx[shtw],
+        recy[shtw],
+        tp=tp,
+        vel=vel,
+        dt=dt,
+        out=out[shtw],
+    )
+    ntrw += nrec[isht]
+  return out
 
 
 def main(args):
@@ -88,34 +147,50 @@ def main(args):
   # Output data
   smute = np.zeros(data.shape, dtype='float32')
 
-  if args.qc:
-    dmin, dmax = np.min(data), np.max(data)
+  if not args.qc:
+    mute_shots(
+        data,
+        srcx,
+        srcy,
+        nrec,
+        strm,
+        recx,
+        recy,
+        engine=args.engine,
+        out=smute,
+    )
+    sep.write_file(args.output_data, smute.T, os=daxes.o, ds=daxes.d)
+    return
 
+  # QC each shot as it is muted
+  dmin, dmax = np.min(data), np.max(data)
   ntrw = 0
   for isht in tqdm(range(nsht), desc="nsht"):
-    smute[ntrw:] = mute_f3shot(
-        data[ntrw:],
+    # Mute only the traces of this shot, in place in the output
+    shtw = slice(ntrw, ntrw + nrec[isht])
+    mute_f3shot(
+        data[shtw],
         srcx[isht],
         srcy[isht],
         nrec[isht],
-        strm[ntrw:],
-        recx[ntrw:],
-        recy[ntrw:],
+        strm[shtw],
+        recx[shtw],
+        recy[shtw],
+        out=smute[shtw],
     )
-    if args.qc:
-      plot_dat2d(data[ntrw:ntrw + nrec[isht], :1500],
-                 show=False,
-                 dt=dt,
-                 dmin=dmin,
-                 dmax=dmax,
-                 pclip=0.01,
-                 aspect=50)
-      plot_dat2d(smute[ntrw:ntrw + nrec[isht], :1500],
-                 dt=dt,
-                 dmin=dmin,
-                 dmax=dmax,
-                 pclip=0.01,
-                 aspect=50)
+    plot_dat2d(data[ntrw:ntrw + nrec[isht], :1500],
+               show=False,
+               dt=dt,
+               dmin=dmin,
+               dmax=dmax,
+               pclip=0.01,
+               aspect=50)
+    plot_dat2d(smute[ntrw:ntrw + nrec[isht], :1500],
+               dt=dt,
+               dmin=dmin,
+               dmax=dmax,
+               pclip=0.01,
+               aspect=50)
     ntrw += nrec[isht]
 
   sep.write_file(args.output_data, smute.T, os=daxes.o, ds=daxes.d)
@@ -132,6 +207,16 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument("--output-data", type=str, default=None)
   parser.add_argument("--water-vel", type=float, default=1450)
   parser.add_argument("--qc", action='store_true', default=False)
+  parser.add_argument(
+      "--engine",
+      type=str,
+      choices=['mdsuops', 'batched'],
+      default='mdsuops',
+      help=("mdsuops mutes each streamer of each shot with mdsuops.mute. "
+            "batched computes the onsets of all traces at once and applies "
+            "a sin^2 taper with numpy. Both use the mute parameters of "
+            "mute_f3shot"),
+  )
   return parser
 
 
@@ -0,0 +1,194 @@
+import numpy as np
+
+
+def mute_window(dat, dt, dx, v0, t0, tp, half=False, hyper=True) -> np.ndarray:
+  """
+  Mutes the traces of a streamer segment (numpy version of mdsuops.mute)
+
+  The mute of the trace ix starts at the offset x = ix*dx along the segment
+  at time sqrt(t0^2 + (x/v0)^2) (t0 + x/v0 if not hyper). Samples before
+  the onset are zeroed and a sin^2 taper of length tp is applied after it
+
+  Parameters:
+    dat   - input traces [ntr,nt]
+    dt    - temporal sampling interval
+    dx    - spacing between receivers
+    v0    - mute velocity
+    t0    - onset time of the first trace
+    tp    - length of taper
+    half  - the offsets are half offsets [False]
+    hyper - hyperbolic (True) or linear moveout [True]
+
+  Returns the muted traces [ntr,nt]
+  """
+  dat = np.asarray(dat)
+  x = dx * np.arange(dat.shape[0])
+  if half:
+    x = 2 * x
+  t = dt * np.arange(dat.shape[1])
+  out = np.zeros(dat.shape, dtype='float32')
+  for ix in range(dat.shape[0]):
+    if hyper:
+      onset = np.sqrt(t0**2 + (x[ix] / v0)**2)
+    else:
+      onset = t0 + x[ix] / v0
+    tau = np.clip((t - onset) / tp, 0.0, 1.0)
+    out[ix] = dat[ix] * np.sin(0.5 * np.pi * tau)**2
+  return out
+
+
+def mute_streamers(
+    dat,
+    isrcx,
+    isrcy,
+    nrec,
+    strm,
+    recx,
+    recy,
+    kernel,
+    tp=0.5,
+    vel=1450.0,
+    dt=0.004,
+    dx=0.025,
+    hyper=True,
+    out=None,
+) -> np.ndarray:
+  """
+  Mutes each streamer segment of a shot from the F3 dataset with a mute
+  kernel (mdsuops.mute or mute_window)
+
+  Parameters:
+    dat    - an input shot gather from the F3 dataset [ntr,nt]
+    isrcx  - x source coordinate of the shot [float]
+    isrcy  - y source coordinate of the shot [float]
+    nrec   - number of traces of the shot
+    strm   - index within the streamer
+    recx   - x receiver coordinates for this shot [ntr]
+    recy   - y receiver coordinates for this shot [ntr]
+    kernel - mute of a segment, called as kernel(dat, dt=, dx=, v0=, t0=,
+             tp=, half=, hyper=)
+    tp     - length of taper [0.5s]
+    vel    - water velocity [1450.0]
+    dt     - temporal sampling interval [0.004]
+    dx     - spacing between receivers [25 m]
+    hyper  - hyperbolic (True) or linear moveout [True]
+    out    - output array [ntr,nt] the muted shot is written to [None]
+
+  Returns a muted shot gather (out if given)
+  """
+  if out is None:
+    mut = np.zeros(dat.shape, dtype='float32')
+  else:
+    mut = out
+    mut[...] = 0.0
+  v0 = vel * 0.001
+  # Find the beginning indices of the streamer
+  idxs = list(np.where(strm[:nrec] == 1)[0])
+  idxs.append(nrec)
+  for istr in range(1, len(idxs)):
+    irecx, irecy = recx[idxs[istr - 1]], recy[idxs[istr - 1]]
+    dist = np.sqrt((isrcx - irecx)**2 + (isrcy - irecy)**2)
+    t0 = dist / vel
+    if (t0 > 0.15):
+      t0 = dist / (vel)
+      v0 = 1.5
+    else:
+      v0 = vel * 0.001
+    mut[idxs[istr - 1]:idxs[istr]] = np.squeeze(
+        kernel(
+            dat[idxs[istr - 1]:idxs[istr]],
+            dt=dt,
+            dx=dx,
+            v0=v0,
+            t0=t0,
+            tp=tp,
+            half=False,
+            hyper=hyper,
+        ))
+  return mut
+
+
+def mute_onsets(
+    srcx,
+    srcy,
+    nrec,
+    strm,
+    recx,
+    recy,
+    vel=1450.0,
+    dx=0.025,
+    hyper=True,
+) -> np.ndarray:
+  """
+  Computes the mute onset time of every trace of a block of F3 shots
+
+  Uses the same moveout as mute_streamers: each streamer segment (starting
+  at strm == 1) starts at the direct arrival time t0 of its first receiver
+  and the onset grows with the receiver index along the segment
+
+  Parameters:
+    srcx  - x source coordinates of the shots [nsht]
+    srcy  - y source coordinates of the shots [nsht]
+    nrec  - number of traces of each shot [nsht]
+    strm  - index within the streamer of each trace [ntr]
+    recx  - x receiver coordinates [ntr]
+    recy  - y receiver coordinates [ntr]
+    vel   - water velocity [1450.0]
+    dx    - spacing between receivers [0.025 km]
+    hyper - hyperbolic (True) or linear moveout [True]
+
+  Returns the onset times [ntr] in seconds. Traces before the first
+  streamer of their shot get an infinite onset (fully muted)
+  """
+  nrec = np.asarray(nrec, dtype='int64')
+  ntr = int(np.sum(nrec))
+  itr = np.arange(ntr)
+  # Shot of each trace and its first trace
+  isht = np.repeat(np.arange(len(nrec)), nrec)
+  first = np.repeat(np.cumsum(nrec) - nrec, nrec)
+  # First trace of the streamer segment of each trace
+  starts = np.where(np.asarray(strm[:ntr]) == 1, itr, -1)
+  seg = np.maximum.accumulate(starts) if ntr > 0 else starts
+  valid = seg >= first
+  seg = np.where(valid, seg, itr)
+  # Direct arrival at the first receiver of each segment
+  dist = np.sqrt((srcx[isht] - recx[seg])**2 + (srcy[isht] - recy[seg])**2)
+  t0 = dist / vel
+  v0 = np.where(t0 > 0.15, 1.5, vel * 0.001)
+  x = (itr - seg) * dx
+  if hyper:
+    onset = np.sqrt(t0**2 + (x / v0)**2)
+  else:
+    onset = t0 + x / v0
+  onset[~valid] = np.inf
+  return onset
+
+
+def mute_batch(data, onsets, dt, tp=0.5, ot=0.0, out=None, block=4096):
+  """
+  Mutes a block of traces given the mute onset of each trace
+
+  Samples before the onset are zeroed and a sin^2 taper of length tp is
+  applied after it. The weights are built for blocks of traces so the
+  memory overhead is bounded by the block size
+
+  Parameters:
+    data   - input traces [ntr,nt]
+    onsets - mute onset time of each trace [ntr] (see mute_onsets)
+    dt     - temporal sampling interval
+    tp     - length of taper [0.5s]
+    ot     - time of the first sample [0.0]
+    out    - output array [ntr,nt] (may be data) [None]
+    block  - number of traces processed at once [4096]
+
+  Returns the muted traces (out if given)
+  """
+  if out is None:
+    out = np.empty(data.shape, dtype='float32')
+  t = ot + dt * np.arange(data.shape[1], dtype='float32')
+  for beg in range(0, data.shape[0], block):
+    end = min(beg + block, data.shape[0])
+    tau = (t[np.newaxis, :] - onsets[beg:end, np.newaxis]) / tp
+    wgt = np.sin(0.5 * np.pi * np.clip(tau, 0.0, 1.0))**2
+    np.multiply(data[beg:end], wgt, out=out[beg:end], casting='unsafe')
+  return out
@@ -1,12 +1,37 @@
 import os
+import sys
+import time
 import argparse
 import subprocess
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from adf.gradopt.utils import create_inttag
+from fingerprint import (file_digest, sep_digests, fingerprint,
+                         read_fingerprint, write_fingerprint)
+from process_chunk import chunk_inputs
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESS_CHUNK = os.path.join(SCRIPT_DIR, 'process_chunk.py')
 
-def main(args):
+# Code of the chunk processing (part of the fingerprint of each output)
+CODE_FILES = ('process_chunk.py', 'mute_da.py', 'mute_ops.py',
+              'debubble_shots.py', 'gnc_correction.py')
+
+# Environment variables that limit the threads of numerical libraries
+THREAD_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def chunk_tasks(args):
+  """
+  Builds the process_chunk.py commands of the chunks to process
+
+  Chunks in the omit list are skipped, chunks in the noisy list are
+  processed with a high energy level and chunks in the fg list use the
+  'chunk_XXXfg' directory names
 
+  Returns a list of (chunk_name, output_name, command) tuples
+  """
   # Read in file lists
   with open(args.noisy_chunk_list, 'r') as f:
     noisy_chunks = [line.rstrip() for line in f.readlines()]
@@ -17,36 +42,198 @@ def main(args):
   with open(args.fg_chunk_list, 'r') as f:
     fg_chunks = [line.rstrip().split('chunk_')[-1] for line in f.readlines()]
 
-  base_cmd = """
-  python scripts/process_chunk.py \
-    --chunk-dir=%s \
-    --output-data=%s
-  """
-
-  noisy_cmd = """
-  python scripts/process_chunk.py \
-    --chunk-dir=%s \
-    --output-data=%s \
-    --energy-level=1e8
-  """
-
   # Make chunk names
+  tasks = []
   for i in range(args.start_idx, args.end_idx + 1):
     tag = create_inttag(i, 100)
     if tag in fg_chunks:
       chunk_name = 'chunk_%sfg' % create_inttag(i, 100)
     else:
       chunk_name = 'chunk_%s' % create_inttag(i, 100)
-    print(chunk_name)
+    if chunk_name in omit_chunks:
+      continue
     chunk_dir = os.path.join(args.root_dir, chunk_name)
-    if chunk_name not in omit_chunks:
-      if chunk_name in noisy_chunks:
-        output_name = os.path.join(chunk_dir, chunk_name + '.npy')
-        cmd = noisy_cmd % (chunk_dir, output_name)
-      else:
-        output_name = os.path.join(chunk_dir, chunk_name + '.npy')
-        cmd = base_cmd % (chunk_dir, output_name)
-      subprocess.check_call(cmd, shell=True)
+    output_name = os.path.join(chunk_dir, chunk_name + '.npy')
+    cmd = [
+        sys.executable,
+        PROCESS_CHUNK,
+        '--chunk-dir=%s' % (chunk_dir),
+        '--output-data=%s' % (output_name),
+        '--input-filter=%s' % (args.input_filter),
+        '--input-lags=%s' % (args.input_lags),
+    ]
+    if chunk_name in noisy_chunks:
+      cmd.append('--energy-level=1e8')
+    tasks.append((chunk_name, output_name, cmd))
+  return tasks
+
+
+def chunk_fingerprint(task, filter_files, cache, shared_cache=None):
+  """
+  Computes the fingerprint of the output of a chunk
+
+  The fingerprint covers the contents of the chunk inputs, of the debubble
+  filter and lags and of the processing code, and the processing parameters
+
+  Parameters:
+    task         - (chunk_name, output_name, command) tuple from chunk_tasks
+    filter_files - paths to the SEP filter and lags files
+    cache        - digest cache of the chunk inputs (updated)
+    shared_cache - digest cache of the files shared by all chunks [None]
+  """
+  _, output_name, cmd = task
+  digests = {}
+  for key, fname in chunk_inputs(os.path.dirname(output_name)).items():
+    digests.update(sep_digests(key, fname, cache))
+  for name, fname in zip(('filter', 'lags'), filter_files):
+    digests.update(sep_digests(name, fname, shared_cache))
+  for code in CODE_FILES:
+    digests[code] = file_digest(os.path.join(SCRIPT_DIR, code), shared_cache)
+  # The arguments of the command (not the interpreter or script paths)
+  return fingerprint(digests, cmd[2:])
+
+
+def run_chunk(
+    task,
+    log_dir=None,
+    retries=0,
+    env=None,
+    filter_files=None,
+    force=False,
+    shared_cache=None,
+):
+  """
+  Runs the processing of a chunk, retrying it if it fails
+
+  If filter_files are given, a fingerprint of the output is saved next to
+  it (in output_name.fingerprint) once the chunk succeeds, and the chunk is
+  skipped if its output exists and its fingerprint did not change
+
+  Parameters:
+    task         - (chunk_name, output_name, command) tuple from chunk_tasks
+    log_dir      - directory of the per-chunk logs (None prints to the console)
+    retries      - number of times a failed chunk is rerun [0]
+    env          - environment of the process [environment of this process]
+    filter_files - paths to the SEP filter and lags files [None]
+    force        - run the chunk even if its output is up to date [False]
+    shared_cache - digest cache of the files shared by all chunks [None]
+
+  Returns the chunk name, the return code, the number of attempts (0 if it
+  was up to date), the elapsed time and the path of the log
+  """
+  chunk_name, output_name, cmd = task
+  beg = time.time()
+  fp = None
+  if filter_files is not None:
+    fp_name = output_name + '.fingerprint'
+    prev = read_fingerprint(fp_name)
+    cache = {} if prev is None else prev['files']
+    try:
+      fp = chunk_fingerprint(task, filter_files, cache, shared_cache)
+    except OSError:
+      # Missing inputs, the processing reports the error
+      pass
+    uptodate = (prev is not None and prev['fingerprint'] == fp and
+                os.path.exists(output_name))
+    if fp is not None and uptodate and not force:
+      return chunk_name, 0, 0, time.time() - beg, None
+    # The output is not valid until this run succeeds (a run killed while
+    # writing it must not leave the previous fingerprint behind)
+    if prev is not None:
+      os.remove(fp_name)
+  log_name = None
+  if log_dir is not None:
+    log_name = os.path.join(log_dir, chunk_name + '.log')
+  for attempt in range(1, retries + 2):
+    if log_name is None:
+      ret = subprocess.call(cmd, env=env)
+    else:
+      with open(log_name, 'w' if attempt == 1 else 'a') as f:
+        f.write('# attempt %d: %s\n' % (attempt, ' '.join(cmd)))
+        f.flush()
+        ret = subprocess.call(cmd,
+                              stdout=f,
+                              stderr=subprocess.STDOUT,
+                              env=env)
+    if ret == 0:
+      break
+  if ret == 0 and fp is not None:
+    write_fingerprint(fp_name, {'fingerprint': fp, 'files': cache})
+  return chunk_name, ret, attempt, time.time() - beg, log_name
+
+
+def main(args):
+
+  tasks = chunk_tasks(args)
+
+  log_dir = args.log_dir
+  if log_dir is None and args.jobs > 1:
+    log_dir = os.path.join(args.root_dir, 'logs')
+  if log_dir is not None:
+    os.makedirs(log_dir, exist_ok=True)
+
+  env = None
+  if args.threads_per_job is not None:
+    env = dict(os.environ)
+    for var in THREAD_VARS:
+      env[var] = str(args.threads_per_job)
+
+  filter_files = None
+  if not args.no_cache:
+    filter_files = (args.input_filter, args.input_lags)
+
+  run = partial(
+      run_chunk,
+      log_dir=log_dir,
+      retries=args.retries,
+      env=env,
+      filter_files=filter_files,
+      force=args.force,
+      shared_cache={},
+  )
+
+  # Run the chunks with a bounded pool of processes
+  beg = time.time()
+  results = []
+  jobs = max(args.jobs, 1)
+  queue, running, stop = list(reversed(tasks)), set(), False
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    while len(running) > 0 or (len(queue) > 0 and not stop):
+      # Start new chunks only as others finish (none after a failure)
+      while len(running) < jobs and len(queue) > 0 and not stop:
+        running.add(pool.submit(run, queue.pop()))
+      done, running = wait(running, return_when=FIRST_COMPLETED)
+      for fut in done:
+        chunk_name, ret, nattempt, elapsed, log_name = fut.result()
+        if nattempt == 0:
+          print("[%d/%d] %s up to date" %
+                (len(results) + 1, len(tasks), chunk_name))
+        else:
+          status = 'done' if ret == 0 else 'FAILED (%d)' % (ret)
+          print("[%d/%d] %s %s in %.1fs (%d attempts)" %
+                (len(results) + 1, len(tasks), chunk_name, status, elapsed,
+                 nattempt))
+        results.append((chunk_name, ret, nattempt, log_name))
+        if ret != 0 and not args.keep_going:
+          # Stop at the first failure (the running chunks are finished)
+          stop = True
+
+  # Summary
+  failed = sorted([res for res in results if res[1] != 0])
+  retried = [res for res in results if res[1] == 0 and res[2] > 1]
+  uptodate = [res for res in results if res[2] == 0]
+  print("%d chunks in %.1fs: %d up to date, %d succeeded "
+        "(%d after a retry), %d failed, %d not run" %
+        (len(tasks), time.time() - beg, len(uptodate), len(results) -
+         len(failed) - len(uptodate), len(retried), len(failed),
+         len(tasks) - len(results)))
+  for chunk_name, ret, _, log_name in failed:
+    if log_name is None:
+      print("  %s (return code %d)" % (chunk_name, ret))
+    else:
+      print("  %s (return code %d, see %s)" % (chunk_name, ret, log_name))
+  if len(failed) > 0:
+    sys.exit(1)
 
 
 def attach_args(parser=argparse.ArgumentParser()):
@@ -70,6 +257,61 @@ def attach_args(parser=argparse.ArgumentParser()):
       type=str,
       default='./doc/fg-chunks.txt',
   )
+  parser.add_argument(
+      "--input-filter",
+      type=str,
+      default="./debubble_data/filter.H",
+  )
+  parser.add_argument(
+      "--input-lags",
+      type=str,
+      default="./debubble_data/lags.H",
+  )
+  parser.add_argument(
+      "--force",
+      action='store_true',
+      default=False,
+      help="Process the chunks even if their outputs are up to date",
+  )
+  parser.add_argument(
+      "--no-cache",
+      action='store_true',
+      default=False,
+      help=("Do not check or record the fingerprints of the outputs "
+            "(always processes every chunk)"),
+  )
+  parser.add_argument(
+      "--jobs",
+      type=int,
+      default=1,
+      help="Number of chunks processed concurrently",
+  )
+  parser.add_argument(
+      "--retries",
+      type=int,
+      default=0,
+      help="Number of times a failed chunk is rerun",
+  )
+  parser.add_argument(
+      "--keep-going",
+      action='store_true',
+      default=False,
+      help=("Keep processing the other chunks after a chunk fails (by "
+            "default no new chunk is started after a failure)"),
+  )
+  parser.add_argument(
+      "--log-dir",
+      type=str,
+      default=None,
+      help=("Directory of the per-chunk logs [ROOT_DIR/logs with --jobs > 1, "
+            "console otherwise]"),
+  )
+  parser.add_argument(
+      "--threads-per-job",
+      type=int,
+      default=None,
+      help="Limits the threads of numerical libraries in each chunk process",
+  )
   return parser
 
 
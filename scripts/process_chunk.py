@@ -1,106 +1,106 @@
 import os
 import argparse
 import numpy as np
-import subprocess
 
 from regio import seppy
+from mute_da import mute_shots
+from debubble_shots import debubble, read_filter
+from gnc_correction import gnc_correct
 
 
-def main(args):
-  # Get the file names for this chunk
-  files = os.listdir(args.chunk_dir)
-  files = list(filter(lambda f: '.H' in f, files))
+KEYS = ('f3_shots', 'f3_srcx', 'f3_recx', 'f3_srcy', 'f3_recy', 'f3_nrec',
+        'f3_strm')
+
+
+def chunk_inputs(chunk_dir) -> dict:
+  """ Returns the input SEP file of each of KEYS in a chunk directory """
+  files = os.listdir(chunk_dir)
+  files = list(filter(lambda f: f.endswith('.H'), files))
   files = list(
       filter(
           lambda f: 'mute' not in f and 'debubble' not in f and 'processed'
           not in f and 'gnc' not in f, files))
+  return {
+      key: os.path.join(chunk_dir, ifile)
+      for key in KEYS for ifile in sorted(files) if key in ifile
+  }
 
-  keys = [
-      'f3_shots', 'f3_srcx', 'f3_recx', 'f3_srcy', 'f3_recy', 'f3_nrec',
-      'f3_strm'
-  ]
 
-  ddict = {
-      key: os.path.join(args.chunk_dir, ifile)
-      for key in keys for ifile in files if key in ifile
-  }
+def main(args):
+  # Get the file names for this chunk
+  ddict = chunk_inputs(args.chunk_dir)
 
   suffix = ddict['f3_shots'].split('f3_shots')[-1]
 
+  sep = seppy.sep()
+  hdrs = {}
+  for key in KEYS:
+    if key != 'f3_shots':
+      _, hdrs[key] = sep.read_file(ddict[key])
+  hdrs['f3_nrec'] = hdrs['f3_nrec'].astype('int32')
+  daxes, data = sep.read_file(ddict['f3_shots'])
+  data = data.reshape(daxes.n, order='F').T
+  data = np.ascontiguousarray(data, dtype='float32')
+  dt = daxes.d[0]
+
   # First mute the data
-  mute_output = os.path.join(args.chunk_dir, 'f3_mute' + suffix)
-  mute_cmd = """
-  python ./scripts/mute_da.py --input-data=%s \
-    --srcx=%s \
-    --recx=%s \
-    --srcy=%s \
-    --recy=%s \
-    --nrec-per-shot=%s \
-    --streamer-header=%s \
-    --output-data=%s \
-    --water-vel=%f
-  """ % (ddict['f3_shots'], ddict['f3_srcx'], ddict['f3_recx'],
-         ddict['f3_srcy'], ddict['f3_recy'], ddict['f3_nrec'], ddict['f3_strm'],
-         mute_output, args.water_vel)
   if args.verb:
-    print(mute_cmd)
-  subprocess.check_call(mute_cmd, shell=True)
-
-  # Now debubble the data
-  debubble_output = os.path.join(args.chunk_dir, 'f3_debubble' + suffix)
-  debubble_cmd = """
-  python ./scripts/debubble_shots.py --input-data=%s \
-    --input-filter=%s \
-    --input-lags=%s \
-    --output-data=%s \
-    --verb
-  """ % (mute_output, args.input_filter, args.input_lags, debubble_output)
+    print("Muting %s" % (ddict['f3_shots']))
+  work = mute_shots(
+      data,
+      hdrs['f3_srcx'],
+      hdrs['f3_srcy'],
+      hdrs['f3_nrec'],
+      hdrs['f3_strm'],
+      hdrs['f3_recx'],
+      hdrs['f3_recy'],
+      engine=args.mute_engine,
+  )
+  if args.keep_intermediates:
+    mute_output = os.path.join(args.chunk_dir, 'f3_mute' + suffix)
+    sep.write_file(mute_output, work.T, os=daxes.o, ds=daxes.d)
+
+  # Now debubble the data (the input buffer is reused for the output)
   if args.verb:
-    print(debubble_cmd)
-  subprocess.check_call(debubble_cmd, shell=True)
+    print("Debubbling")
+  lags, invflt = read_filter(sep, args.input_filter, args.input_lags)
+  work = debubble(work, lags, invflt, out=data, verb=True)
+  if args.keep_intermediates:
+    debubble_output = os.path.join(args.chunk_dir, 'f3_debubble' + suffix)
+    sep.write_file(debubble_output, work.T, os=daxes.o, ds=daxes.d)
+
+  # GNC Correction
+  if args.verb:
+    print("GNC correction")
+  work = gnc_correct(
+      work,
+      dt,
+      time_shift=args.time_shift,
+      max_time=args.max_time,
+      energy_level=args.energy_level,
+      energy_qc=args.energy_qc,
+  )
 
   if args.output_data is None:
     args.output_data = os.path.join(args.chunk_dir,
                                     'f3_processed' + suffix)
-  # GNC Correction
   ftype = os.path.splitext(args.output_data)[-1]
-  energy_qc = "--energy-qc" if args.energy_qc else ""
-  base_gnc_cmd = """
-  python ./scripts/gnc_correction.py --input-data=%s \
-    --time-shift=%f \
-    --max-time=%f \
-    --energy-level=%f %s \
-    --output-data=%s
-  """
   if ftype == '.npy':
-    sep = seppy.sep()
-    gnc_output = os.path.join(args.chunk_dir, 'f3_processed' + suffix)
-    gnc_cmd = base_gnc_cmd % (debubble_output, args.time_shift, args.max_time,
-                              args.energy_level, energy_qc, gnc_output)
-    if args.verb:
-      print(gnc_cmd)
-    subprocess.check_call(gnc_cmd, shell=True)
-    # Now read in all files and write to .npz
+    # Write the processed shots and their headers to a single file
     odict = {}
-    for key, ifile in ddict.items():
-      if key == 'f3_shots':
-        daxes, data = sep.read_file(gnc_output)
-        data = data.reshape(daxes.n, order='F').T
-        odict['dt'] = daxes.d[0]
-        odict[key] = np.ascontiguousarray(data).astype('float32')
-      elif key == 'f3_nrec':
-        daxes, data = sep.read_file(ifile)
-        odict[key] = data.astype('int32')
+    odict['dt'] = dt
+    odict['f3_shots'] = np.ascontiguousarray(work, dtype='float32')
+    for key, hdr in hdrs.items():
+      if key == 'f3_nrec':
+        odict[key] = hdr.astype('int32')
       elif key != 'f3_strm':
-        daxes, data = sep.read_file(ifile)
-        odict[key] = data.astype('float32')
+        odict[key] = hdr.astype('float32')
     np.save(args.output_data, odict)
+    if args.keep_intermediates:
+      processed_output = os.path.join(args.chunk_dir, 'f3_processed' + suffix)
+      sep.write_file(processed_output, work.T, os=daxes.o, ds=daxes.d)
   else:
-    gnc_cmd = base_gnc_cmd % (debubble_output, args.time_shift, args.max_time,
-                              args.energy_level, energy_qc, args.output_data)
-    if args.verb:
-      print(gnc_cmd)
-    subprocess.check_call(gnc_cmd, shell=True)
+    sep.write_file(args.output_data, work.T, os=daxes.o, ds=daxes.d)
 
 
 def attach_args(parser=argparse.ArgumentParser()):
@@ -122,6 +122,21 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument("--energy-level", type=float, default=-1)
   parser.add_argument("--energy-qc", action='store_true', default=False)
   parser.add_argument("--output-data", type=str, default=None)
+  parser.add_argument(
+      "--mute-engine",
+      type=str,
+      choices=['mdsuops', 'batched'],
+      default='mdsuops',
+      help="Mute engine (see mute_da.py --engine)",
+  )
+  parser.add_argument(
+      "--keep-intermediates",
+      action='store_true',
+      default=False,
+      help=("Also write the muted (f3_mute), debubbled (f3_debubble) and, "
+            "with a .npy output, processed (f3_processed) SEP files of the "
+            "chunk (needed by interactive_qc_chunk.py)"),
+  )
   parser.add_argument("--verb", action='store_true', default=False)
   return parser
 
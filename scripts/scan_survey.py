@@ -0,0 +1,163 @@
+import os
+import argparse
+import numpy as np
+from mpi4py import MPI
+from tqdm import tqdm
+
+from regio import seppy
+from utils import chunks
+from header_index import (index_segy, write_table, source_stats,
+                          write_source_stats)
+from src_map import write_source_map
+from make_srcinfo_files import write_srcinfo_file
+
+
+def _scan_segys(rank, segys, args):
+  """ Reads the trace headers of each file once and derives its products """
+  scans = []
+  with tqdm(total=len(segys), desc='%d nsegy' % (rank),
+            position=rank + 1) as pbar:
+    for segy in segys:
+      hdrs, row = index_segy(segy, args.output_index_dir)
+      srccoords = np.zeros([len(hdrs), 2], dtype='int')
+      srccoords[:, 0] = hdrs['srcy']
+      srccoords[:, 1] = hdrs['srcx']
+      # Unique sources of this file and their trace counts
+      ucoords, cts = np.unique(srccoords, axis=0, return_counts=True)
+      fname = os.path.splitext(os.path.basename(segy))[0]
+      write_srcinfo_file(
+          os.path.join(args.output_info_dir, fname + '.txt'),
+          ucoords,
+          cts,
+      )
+      scan = {'row': row, 'usrcs': ucoords, 'stats': source_stats(hdrs)}
+      if args.src_coords is not None:
+        scan['src'] = srccoords.astype('float32')
+      if args.rec_coords is not None:
+        reccoords = np.zeros([len(hdrs), 2], dtype='float32')
+        reccoords[:, 0] = hdrs['recy']
+        reccoords[:, 1] = hdrs['recx']
+        scan['rec'] = reccoords
+      scans.append(scan)
+      pbar.update(1)
+  return scans
+
+
+def main(args):
+  comm = MPI.COMM_WORLD
+
+  rank = comm.Get_rank()
+  size = comm.Get_size()
+
+  if rank == 0:
+    segys = sorted([
+        os.path.join(args.segy, isegy)
+        for isegy in os.listdir(args.segy)
+        if '.segy' in isegy
+    ])
+    for odir in [args.output_info_dir, args.output_index_dir]:
+      if not os.path.isdir(odir):
+        os.mkdir(odir)
+    segy_chunks = list(chunks(segys, size))
+  else:
+    segy_chunks = None
+
+  segy_chunk = comm.scatter(segy_chunks, root=0)
+
+  scans = _scan_segys(rank, segy_chunk, args)
+
+  all_scans = comm.gather(scans, root=0)
+
+  if rank == 0:
+    # Ranks hold contiguous chunks of the sorted file list
+    scans = [scan for rscans in all_scans for scan in rscans]
+
+    # Header index file table
+    write_table(args.output_index_dir, [scan['row'] for scan in scans])
+    write_source_stats(args.output_index_dir, [scan['stats'] for scan in scans])
+
+    # Source to file hash map
+    usrcs = [scan['usrcs'] for scan in scans]
+    fileids = [np.full(len(iusrcs), k) for k, iusrcs in enumerate(usrcs)]
+    usrcs = np.concatenate(usrcs, axis=0)
+    write_source_map(
+        args.output_hmap,
+        usrcs[:, 0],
+        usrcs[:, 1],
+        np.concatenate(fileids),
+        [scan['row']['path'] for scan in scans],
+    )
+
+    # Unique source coordinates
+    np.save(args.output_scoords, np.unique(usrcs.astype('float64'), axis=0))
+
+    # All source and receiver coordinates
+    sep = seppy.sep()
+    if args.src_coords is not None:
+      all_scoords = np.concatenate([scan['src'] for scan in scans], axis=0)
+      sep.write_file(args.src_coords, all_scoords)
+      if args.unique_src_coords is not None:
+        sep.write_file(args.unique_src_coords, np.unique(all_scoords, axis=0))
+    if args.rec_coords is not None:
+      all_rcoords = np.concatenate([scan['rec'] for scan in scans], axis=0)
+      sep.write_file(args.rec_coords, all_rcoords)
+
+
+def attach_args(parser=argparse.ArgumentParser()):
+  info_dir = "/net/brick5/data3/northsea_dutch_f3/segy/info_new"
+  parser.add_argument(
+      "--segy",
+      type=str,
+      default="/net/brick5/data3/northsea_dutch_f3/segy",
+      help="Path to segy files",
+  )
+  parser.add_argument(
+      "--output-info-dir",
+      type=str,
+      default=info_dir,
+      help="Output per-file source info files",
+  )
+  parser.add_argument(
+      "--output-index-dir",
+      type=str,
+      default=os.path.join(info_dir, 'hdr_index'),
+      help="Output trace header index",
+  )
+  parser.add_argument(
+      "--output-hmap",
+      type=str,
+      default=os.path.join(info_dir, 'src_hmap'),
+      help="Output source to file hash map",
+  )
+  parser.add_argument(
+      "--output-scoords",
+      type=str,
+      default=os.path.join(info_dir, 'scoords.npy'),
+      help="Output unique source coordinates (.npy)",
+  )
+  parser.add_argument(
+      "--src-coords",
+      type=str,
+      default=None,
+      required=False,
+      help="Output source coordinates of all traces",
+  )
+  parser.add_argument(
+      "--unique-src-coords",
+      type=str,
+      default=None,
+      required=False,
+      help="Output unique source coordinates (requires --src-coords)",
+  )
+  parser.add_argument(
+      "--rec-coords",
+      type=str,
+      default=None,
+      required=False,
+      help="Output receiver coordinates of all traces",
+  )
+  return parser
+
+
+if __name__ == "__main__":
+  main(attach_args().parse_args())
@@ -0,0 +1,16 @@
+#! /bin/bash
+
+ROOT_DIR=/net/brick5/data3/northsea_dutch_f3
+
+set -x
+
+mpirun --hostfile=hostfile.txt -np=32 \
+  python scripts/scan_survey.py \
+  --segy=${ROOT_DIR}/segy \
+  --output-info-dir=${ROOT_DIR}/segy/info_new \
+  --output-index-dir=${ROOT_DIR}/segy/info_new/hdr_index \
+  --output-hmap=${ROOT_DIR}/segy/info_new/src_hmap \
+  --output-scoords=${ROOT_DIR}/segy/info_new/scoords.npy \
+  --src-coords=./all_src_coords.H \
+  --rec-coords=./all_rec_coords.H \
+  --unique-src-coords=./unique_src_coords.H
@@ -1,18 +1,27 @@
 import argparse
-import segyio
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
 from regio import seppy
+from shot_reader import ShotReader
+from spatial_index import NearestIndex
+from src_map import SourceMap
+from shot_writer import ShotWriter
 
 
 def main(args):
   sep = seppy.sep()
 
-  # Read in the source hash map and the source coordinates
-  hmap = np.load(args.src_hash_map, allow_pickle=True)[()]
+  # Open the source hash map and read in the source coordinates
+  hmap = SourceMap(args.src_hash_map)
   crds = np.load(args.src_coords, allow_pickle=True)[()]
+  # Reads shots using the trace header index
+  reader = ShotReader(
+      args.header_index,
+      max_files=args.cache_files,
+      max_bytes=args.cache_mb * 2**20,
+  )
 
   # Grid origin and sampling of the original grid
   ox, oy = 469800, 6072350
@@ -55,22 +64,35 @@ def main(args):
       fcrds.append(crds[icrd])
   fcrds = np.asarray(fcrds)
 
+  # Find the nearest source to each grid point
+  gsys, gsxs = np.meshgrid(sys, sxs, indexing='ij')
+  nidx = NearestIndex(fcrds).nearest(np.stack([gsys, gsxs], axis=-1))
+  nidx = nidx.reshape(nsy, nsx)
+
+  # Buffers the selected shots and writes them in blocks
+  writer = ShotWriter(
+      {
+          'srcx': args.output_srcx_coords,
+          'srcy': args.output_srcy_coords,
+          'recx': args.output_recx_coords,
+          'recy': args.output_recy_coords,
+          'nrec': args.output_nrec_per_shot,
+          'streamer': args.output_streamer_hdr,
+          'shots': args.output_shots,
+      },
+      dt=dt,
+      max_bytes=args.buffer_mb * 2**20,
+  )
+
   ctr = 0
-  dmap = {}
   srcs = set()
   rsxs, rsys = [], []
   with tqdm(total=nsy * nsx, desc='nshots') as pbar:
     for isy in range(nsy):
-      gsy = sys[isy]
       for isx in range(nsx):
         pbar.update(1)
-        gsx = sxs[isx]
-        # Compute the distance between this point and
-        # all of the source coordinates
-        dists = np.sqrt((gsy - fcrds[:, 0])**2 + (gsx - fcrds[:, 1])**2)
-        # Find this coordinate
-        idx = np.argmin(dists)
-        rsy, rsx = fcrds[idx]
+        # Nearest source to this grid point
+        rsy, rsx = fcrds[nidx[isy, isx]]
         # If we have seen these source before, keep going
         if ((rsy, rsx) in srcs):
           print("Saw %d %d before, not writing" % (rsy, rsx))
@@ -80,67 +102,18 @@ def main(args):
           srcs.add((rsy, rsx))
         rsys.append(rsy)
         rsxs.append(rsx)
-        # Get the key that tells us which files contain the data
-        key = str(int(rsy)) + ' ' + str(int(rsx))
-        recxinfo, recyinfo = [], []
-        strminfo, tidcinfo = [], []
-        srcdat = []
-        for ifile in hmap[key]:
-          if (ifile not in dmap):
-            dmap[ifile] = segyio.open(ifile, ignore_geometry=True)
-          # Get the source coordinates
-          srcxf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.SourceX),
-              dtype='int32',
-          )
-          srcyf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.SourceY),
-              dtype='int32',
-          )
-          # Get the receiver coordinates
-          recxf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.GroupX),
-              dtype='int32',
-          )
-          recyf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.GroupY),
-              dtype='int32',
-          )
-          # Get the streamer header
-          strmr = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.CDP_TRACE),
-              dtype='int32',
-          )
-          # Get the trace identification code
-          tidcd = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.TraceIdentificationCode),
-              dtype='int32',
-          )
-          # Find the traces with that source coordinate
-          scoordsf = np.zeros([len(srcxf), 2], dtype='int32')
-          scoordsf[:, 0] = srcyf
-          scoordsf[:, 1] = srcxf
-          idx1 = scoordsf == fcrds[idx]
-          s = np.sum(idx1, axis=1)
-          nidx1 = s == 2
-          # Get receiver coordinates for this shot
-          recxinfo.append(recxf[nidx1])
-          recyinfo.append(recyf[nidx1])
-          # Get the streamer header for this shot
-          strminfo.append(strmr[nidx1])
-          # Get the trace identification codes for this shot
-          tidcinfo.append(tidcd[nidx1])
-          # Get the data for this shot
-          data = dmap[ifile].trace.raw[:]
-          srcdat.append(data[nidx1, :])
-        # Concatenate data from different files
-        recxinfo = np.concatenate(recxinfo, axis=0)
-        recyinfo = np.concatenate(recyinfo, axis=0)
-        strminfo = np.concatenate(strminfo, axis=0)
-        tidcinfo = np.concatenate(tidcinfo, axis=0)
-        srcdat = np.concatenate(srcdat, axis=0)
+        # Skip the shots with only dead traces before reading them
+        if reader.hidx.dead_mask(rsy, rsx):
+          print("Bad shot, not reading shot %d %d" % (rsy, rsx))
+          ctr += 1
+          continue
+        # Read only the traces of this shot
+        shot = reader.get_shot(rsy, rsx, hmap.lookup(rsy, rsx))
+        recxinfo, recyinfo = shot['recx'], shot['recy']
+        tidcinfo = shot['tid']
+        srcdat = shot['data']
         ntr, nt = srcdat.shape
-        nrec = len(recxinfo)
+        nrec = shot['nrec']
         # Skip writing if dead traces
         if (np.all(tidcinfo == 2)):
           print("Bad shot, not writing shot %d %d %d" % (ctr, rsy, rsx))
@@ -149,50 +122,8 @@ def main(args):
         # Add the tuple to the set and make sure we have not used it
         if (nrec != len(recyinfo)):
           print("Warning nrecx != nrecy for shot %f %f" % (rsy, rsx))
-        if (isy == 0 and isx == 0):
-          sep.write_file(args.output_srcx_coords, np.asarray([rsx]))
-          sep.write_file(args.output_srcy_coords, np.asarray([rsy]))
-          sep.write_file(
-              args.output_recx_coords,
-              recxinfo.astype('float32'),
-          )
-          sep.write_file(
-              args.output_recy_coords,
-              recyinfo.astype('float32'),
-          )
-          sep.write_file(
-              args.output_nrec_per_shot,
-              np.asarray([nrec], dtype='float32'),
-          )
-          sep.write_file(
-              args.output_streamer_hdr,
-              strminfo.astype('float32'),
-          )
-          sep.write_file(
-              args.output_shots,
-              srcdat.T,
-              ds=[dt, 1.0],
-          )
-        else:
-          sep.append_file(args.output_srcx_coords, np.asarray([rsx]))
-          sep.append_file(args.output_srcy_coords, np.asarray([rsy]))
-          sep.append_file(
-              args.output_recx_coords,
-              recxinfo.astype('float32'),
-          )
-          sep.append_file(
-              args.output_recy_coords,
-              recyinfo.astype('float32'),
-          )
-          sep.append_file(
-              args.output_nrec_per_shot,
-              np.asarray([nrec], dtype='float32'),
-          )
-          sep.append_file(
-              args.output_streamer_hdr,
-              strminfo.astype('float32'),
-          )
-          sep.append_file(args.output_shots, srcdat.T)
+        # Write traces to SEP files
+        writer.write(shot)
         if args.qc:
           # Plot the source receiver geometry for this shot
           fig = plt.figure(figsize=(10, 5))
@@ -235,9 +166,10 @@ def main(args):
           plt.show()
         ctr += 1
 
-  # Close all of the opened files
-  for kvp in dmap.items():
-    kvp[1].close()
+  # Write the remaining shots and close all of the opened files
+  writer.close()
+  print(reader.cache.stats())
+  reader.close()
 
 
 def attach_args(parser=argparse.ArgumentParser()):
@@ -245,13 +177,18 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument(
       "--src-hash-map",
       type=str,
-      default=root_dir + "segy/info_new/src_hmap.npy",
+      default=root_dir + "segy/info_new/src_hmap",
   )
   parser.add_argument(
       "--src-coords",
       type=str,
       default=root_dir + "segy/info_new/scoords.npy",
   )
+  parser.add_argument(
+      "--header-index",
+      type=str,
+      default=root_dir + "segy/info_new/hdr_index",
+  )
   parser.add_argument("--dsx", type=float, default=100)
   parser.add_argument("--dsy", type=float, default=100)
   parser.add_argument("--nxg", type=int, default=500)
@@ -259,6 +196,24 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument("--offset-x", type=int, default=0)
   parser.add_argument("--offset-y", type=int, default=0)
   parser.add_argument("--qc", action='store_true', default=False)
+  parser.add_argument(
+      "--buffer-mb",
+      type=int,
+      default=512,
+      help="Size of the shot buffer before writing [MB]",
+  )
+  parser.add_argument(
+      "--cache-files",
+      type=int,
+      default=64,
+      help="Maximum number of SEG-Y files kept open",
+  )
+  parser.add_argument(
+      "--cache-mb",
+      type=int,
+      default=1024,
+      help="Maximum size of the cached trace headers [MB]",
+  )
   parser.add_argument(
       "--img",
       type=str,
@@ -5,8 +5,9 @@ ROOT_DIR=/net/brick5/data3/northsea_dutch_f3
 set -x
 
 python scripts/select_data.py \
-  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap.npy \
+  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap \
   --src-coords=${ROOT_DIR}/segy/info_new/scoords.npy \
+  --header-index=${ROOT_DIR}/segy/info_new/hdr_index \
   --dsx=100 \
   --dsy=50  \
   --nxg=500 \
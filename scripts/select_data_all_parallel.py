@@ -1,15 +1,55 @@
 import argparse
-import segyio
+from functools import partial
 import numpy as np
 from mpi4py import MPI
 from tqdm import tqdm
 import logging
 
-from regio import seppy
-from utils import chunks
+from utils import chunks, prefetch
+from shot_reader import ShotReader
+from header_index import HeaderIndex
+from src_map import SourceMap
+from shot_writer import ShotWriter, read_manifest
+from shot_plan import affinity_chunks, shared_files
 
 
-def _process_chunk(crdchunk, hmap, fnames, rank, dt=0.002, logdir='./log'):
+# MPI tags of the dynamic scheduler
+_READY, _WORK = 1, 2
+
+
+def _manifest_name(fnames, ftag):
+  """ Returns the progress manifest of the outputs of a rank """
+  return fnames['shots'] % ftag + '.manifest'
+
+
+def _process_chunk(
+    batches,
+    ftag,
+    hmap_dir,
+    hdr_index,
+    fnames,
+    rank,
+    dt=0.002,
+    logdir='./log',
+    buffer_mb=512,
+    cache_files=64,
+    cache_mb=1024,
+    prefetch_depth=0,
+    total=None,
+    resume=False,
+    live_only=False,
+):
+  """
+  Selects and writes the shots of a rank
+
+  Parameters:
+    batches        - iterable of lists of (srcy, srcx) shot coordinates
+    ftag           - tuple used to format the output file names of this rank
+    prefetch_depth - number of shots read ahead while writing [0]
+    total          - total number of shots of this rank (if known)
+    resume         - skip the shots recorded in the manifest of this rank
+    live_only      - drop the dead traces of the shots before reading them
+  """
   # Create a logger
   logging.basicConfig(
       filename='%s/rank-%d.log' % (logdir, rank),
@@ -17,157 +57,96 @@ def _process_chunk(crdchunk, hmap, fnames, rank, dt=0.002, logdir='./log'):
       format='%(asctime)s - %(filename)s:%(lineno)d - %(message)s',
   )
 
-  # Write SEP files
-  sep = seppy.sep()
+  # Memory-mapped map from sources to SEG-Y files
+  hmap = SourceMap(hmap_dir)
+  # Reads shots using the trace header index
+  reader = ShotReader(
+      hdr_index,
+      max_files=cache_files,
+      max_bytes=cache_mb * 2**20,
+  )
 
-  dmap = {}
-  crdarr = np.asarray(crdchunk)
-  ymin, ymax = np.min(crdarr[:, 0]), np.max(crdarr[:, 0])
+  # Buffers the selected shots and writes them in blocks
+  writer = ShotWriter(
+      {key: fname % ftag for key, fname in fnames.items()},
+      dt=dt,
+      max_bytes=buffer_mb * 2**20,
+      manifest=_manifest_name(fnames, ftag),
+      resume=resume,
+  )
+  if len(writer.done) > 0:
+    logging.info("Resuming after %d shots" % (len(writer.done)))
+    if total is not None:
+      total = max(total - len(writer.done), 0)
   # Loop over coordinates
-  for k, crd in tqdm(enumerate(crdchunk),
-                     desc='rank %d nshots' % (rank),
-                     total=len(crdchunk),
-                     position=rank + 1,
-                     nrows=40):
-    srcy, srcx = crd
-    ddict = _get_shot_from_segy(srcy, srcx, hmap, dmap)
-    # Skip writing if dead traces
-    if (np.all(ddict['tid'] == 2)):
-      logging.info("Bad shot, not writing shot %d %d" % (srcy, srcx))
-      continue
-    if ddict['nrec'] != len(ddict['recy']):
-      logging.warning("Warning nrecx != nrecy for shot %f %f" % (srcy, srcx))
-    # Write traces to SEP file
-    if k == 0:
-      _ddict_to_file(ddict, fnames, ymin, ymax, sep, append=False)
+  with tqdm(desc='rank %d nshots' % (rank),
+            total=total,
+            position=rank + 1,
+            nrows=40) as pbar:
+    shots = ((srcy, srcx, hmap.lookup(srcy, srcx))
+             for batch in batches
+             for srcy, srcx in batch
+             if (float(srcy), float(srcx)) not in writer.done)
+    # Read the next shots while the current ones are written
+    read_shot = partial(reader.get_shot, live_only=live_only)
+    for (srcy, srcx, _), ddict in prefetch(read_shot, shots, prefetch_depth):
+      pbar.update(1)
+      # Skip writing if dead traces
+      if (np.all(ddict['tid'] == 2)):
+        logging.info("Bad shot, not writing shot %d %d" % (srcy, srcx))
+        writer.skip(srcy, srcx)
+        continue
+      if ddict['nrec'] != len(ddict['recy']):
+        logging.warning("Warning nrecx != nrecy for shot %f %f" % (srcy, srcx))
+      # Write traces to SEP file
+      writer.write(ddict)
+
+  # Write the remaining shots and close all of the opened files
+  writer.close()
+  logging.info(reader.cache.stats())
+  reader.close()
+
+
+def _schedule_shots(comm, crds, costs, nworkers):
+  """
+  Hands out batches of shots to the workers on demand (guided scheduling)
+
+  Each batch holds about 1/(2*nworkers) of the remaining cost so batches
+  shrink towards the end of the run and the ranks finish together
+
+  Parameters:
+    comm     - MPI communicator (this rank is the master)
+    crds     - list of (srcy, srcx) shot coordinates
+    costs    - estimated cost of each shot [nshots]
+    nworkers - number of worker ranks
+  """
+  ccosts = np.zeros(len(crds) + 1)
+  np.cumsum(costs, out=ccosts[1:])
+  status = MPI.Status()
+  beg, nactive = 0, nworkers
+  while nactive > 0:
+    comm.recv(source=MPI.ANY_SOURCE, tag=_READY, status=status)
+    worker = status.Get_source()
+    if beg < len(crds):
+      target = (ccosts[-1] - ccosts[beg]) / (2 * nworkers)
+      end = np.searchsorted(ccosts, ccosts[beg] + target, side='left')
+      end = min(max(end, beg + 1), len(crds))
+      comm.send(crds[beg:end], dest=worker, tag=_WORK)
+      beg = end
     else:
-      _ddict_to_file(ddict, fnames, ymin, ymax, sep, append=True)
-
-  # Close all of the opened files
-  for kvp in dmap.items():
-    kvp[1].close()
-
-
-def _get_shot_from_segy(srcy, srcx, hmap, dmap):
-  # Output lists
-  srcdat = []
-  recxinfo, recyinfo = [], []
-  strminfo, tidcinfo = [], []
-  # Key in hash map
-  key = str(int(srcy)) + ' ' + str(int(srcx))
-  for ifile in hmap[key]:
-    if (ifile not in dmap):
-      dmap[ifile] = segyio.open(ifile, ignore_geometry=True)
-    # Get the source coordinates
-    srcxf = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.SourceX),
-        dtype='int32',
-    )
-    srcyf = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.SourceY),
-        dtype='int32',
-    )
-    # Get the receiver coordinates
-    recxf = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.GroupX),
-        dtype='int32',
-    )
-    recyf = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.GroupY),
-        dtype='int32',
-    )
-    # Get the streamer header
-    strmr = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.CDP_TRACE),
-        dtype='int32',
-    )
-    # Get the trace identification code
-    tidcd = np.asarray(
-        dmap[ifile].attributes(segyio.TraceField.TraceIdentificationCode),
-        dtype='int32',
-    )
-    # Find the traces with that source coordinate
-    scoordsf = np.zeros([len(srcxf), 2], dtype='int32')
-    scoordsf[:, 0] = srcyf
-    scoordsf[:, 1] = srcxf
-    idx1 = scoordsf == np.asarray([srcy, srcx], dtype='int32')
-    s = np.sum(idx1, axis=1)
-    nidx1 = s == 2
-    # Get receiver coordinates for this shot
-    recxinfo.append(recxf[nidx1])
-    recyinfo.append(recyf[nidx1])
-    # Get the streamer header for this shot
-    strminfo.append(strmr[nidx1])
-    # Get the trace identification codes for this shot
-    tidcinfo.append(tidcd[nidx1])
-    # Get the data for this shot
-    data = dmap[ifile].trace.raw[:]
-    srcdat.append(data[nidx1, :])
-  # Concatenate data from different files
-  recxinfo = np.concatenate(recxinfo, axis=0)
-  recyinfo = np.concatenate(recyinfo, axis=0)
-  strminfo = np.concatenate(strminfo, axis=0)
-  tidcinfo = np.concatenate(tidcinfo, axis=0)
-  srcdat = np.concatenate(srcdat, axis=0)
-  ntr, nt = srcdat.shape
-  nrec = len(recxinfo)
-  return {
-      'srcx': srcx,
-      'srcy': srcy,
-      'recx': recxinfo,
-      'recy': recyinfo,
-      'nrec': nrec,
-      'streamer': strminfo,
-      'tid': tidcinfo,
-      'data': srcdat,
-  }
-
-
-def _ddict_to_file(ddict, fnames, ymin, ymax, sep, append, dt=0.002):
-  if not append:
-    sep.write_file(fnames['srcx'] % (ymin, ymax), np.asarray([ddict['srcx']]))
-    sep.write_file(fnames['srcy'] % (ymin, ymax), np.asarray([ddict['srcy']]))
-    sep.write_file(
-        fnames['recx'] % (ymin, ymax),
-        ddict['recx'].astype('float32'),
-    )
-    sep.write_file(
-        fnames['recy'] % (ymin, ymax),
-        ddict['recy'].astype('float32'),
-    )
-    sep.write_file(
-        fnames['nrec'] % (ymin, ymax),
-        np.asarray([ddict['nrec']], dtype='float32'),
-    )
-    sep.write_file(
-        fnames['streamer'] % (ymin, ymax),
-        ddict['streamer'].astype('float32'),
-    )
-    sep.write_file(
-        fnames['shots'] % (ymin, ymax),
-        ddict['data'].T,
-        ds=[dt, 1.0],
-    )
-  else:
-    sep.append_file(fnames['srcx'] % (ymin, ymax), np.asarray([ddict['srcx']]))
-    sep.append_file(fnames['srcy'] % (ymin, ymax), np.asarray([ddict['srcy']]))
-    sep.append_file(
-        fnames['recx'] % (ymin, ymax),
-        ddict['recx'].astype('float32'),
-    )
-    sep.append_file(
-        fnames['recy'] % (ymin, ymax),
-        ddict['recy'].astype('float32'),
-    )
-    sep.append_file(
-        fnames['nrec'] % (ymin, ymax),
-        np.asarray([ddict['nrec']], dtype='float32'),
-    )
-    sep.append_file(
-        fnames['streamer'] % (ymin, ymax),
-        ddict['streamer'].astype('float32'),
-    )
-    sep.append_file(fnames['shots'] % (ymin, ymax), ddict['data'].T)
+      # No more shots, stop this worker
+      comm.send([], dest=worker, tag=_WORK)
+      nactive -= 1
+
+
+def _request_batches(comm):
+  """ Yields batches of shots requested from the master rank """
+  while True:
+    comm.send(None, dest=0, tag=_READY)
+    batch = comm.recv(source=0, tag=_WORK)
+    if len(batch) == 0:
+      return
+    yield batch
 
 
 def main(args):
@@ -176,9 +155,12 @@ def main(args):
   rank = comm.Get_rank()
   size = comm.Get_size()
 
+  # Rank 0 only schedules in dynamic mode
+  dynamic = args.schedule == 'dynamic' and size > 1
+  affinity = args.schedule == 'affinity'
+
   if rank == 0:
-    # Read in the source hash map and the source coordinates
-    hmap = np.load(args.src_hash_map, allow_pickle=True)[()]
+    # Read in the source coordinates
     crds = np.load(args.src_coords, allow_pickle=True)[()]
     # Sort by inline and then crossline
     crds[crds[:1].argsort()]
@@ -209,6 +191,17 @@ def main(args):
         lambda c: c[0] >= oyw and c[0] < endy and c[1] >= oxw and c[1] < endx,
         crds.tolist())))
 
+    # Remove the shots with only dead traces before reading any data
+    hidx = HeaderIndex(args.header_index)
+    if hidx.src_stats is None:
+      print("No source statistics in %s, dead shots are removed when read" %
+            (args.header_index))
+    elif len(fcrds) > 0:
+      afcrds = np.asarray(fcrds)
+      dead = hidx.dead_mask(afcrds[:, 0], afcrds[:, 1])
+      print("Removing %d dead shots" % (np.sum(dead)))
+      fcrds = [crd for crd, idead in zip(fcrds, dead) if not idead]
+
     fnames = {
         'srcx': args.output_base_srcx_coords,
         'srcy': args.output_base_srcy_coords,
@@ -218,24 +211,80 @@ def main(args):
         'streamer': args.output_base_streamer_hdr,
         'shots': args.output_base_shots,
     }
-    crdchunks = chunks(fcrds, size)
+    if dynamic:
+      # Outputs are named by rank as the shots of a rank are not known
+      crdchunks = [None] * size
+      ftags = [(irank, size) for irank in range(size)]
+    elif affinity:
+      # Keep the shots reading the same files on the same rank
+      hmap = SourceMap(args.src_hash_map)
+      fileids = [hmap.file_ids(srcy, srcx).tolist() for srcy, srcx in fcrds]
+      costs = [len(ifiles) for ifiles in fileids]
+      parts = affinity_chunks(fileids, costs, size)
+      crdchunks = [[fcrds[k] for k in part] for part in parts]
+      # Ranks may span the same y range so outputs are named by rank
+      ftags = [(irank, size) for irank in range(size)]
+      nshared = shared_files([[fileids[k] for k in part] for part in parts])
+      print("File affinity: %d of %d files are read by more than one rank" %
+            (nshared, len(hmap.files)))
+    else:
+      crdchunks = list(chunks(fcrds, size))
+      ftags = [(np.min(np.asarray(icnk)[:, 0]), np.max(np.asarray(icnk)[:, 0]))
+               for icnk in crdchunks]
     allchunks = [{
         'crdchunk': icnk,
-        'hmap': hmap,
+        'ftag': iftag,
+        'hmap_dir': args.src_hash_map,
+        'hdr_index': args.header_index,
         'fnames': fnames,
         'dt': dt,
-    } for icnk in crdchunks]
+        'buffer_mb': args.buffer_mb,
+        'cache_files': args.cache_files,
+        'cache_mb': args.cache_mb,
+        'prefetch': args.prefetch,
+        'resume': args.resume,
+        'live_only': args.drop_dead_traces,
+    } for icnk, iftag in zip(crdchunks, ftags)]
   else:
     allchunks = None
 
   local_chunk = comm.scatter(allchunks, root=0)
 
+  if dynamic and rank == 0:
+    # Estimate the cost of a shot by the number of files it spans
+    hmap = SourceMap(args.src_hash_map)
+    if args.resume:
+      # Only schedule the shots that no worker has done
+      done = set()
+      for irank in range(1, size):
+        mdict = read_manifest(_manifest_name(fnames, (irank, size)))
+        if mdict is not None:
+          done.update(tuple(crd) for crd in mdict['done'])
+      fcrds = [crd for crd in fcrds if tuple(crd) not in done]
+    costs = [len(hmap.file_ids(srcy, srcx)) for srcy, srcx in fcrds]
+    _schedule_shots(comm, fcrds, costs, size - 1)
+    return
+
+  if dynamic:
+    batches, total = _request_batches(comm), None
+  else:
+    batches, total = [local_chunk['crdchunk']], len(local_chunk['crdchunk'])
+
   _process_chunk(
-      local_chunk['crdchunk'],
-      local_chunk['hmap'],
+      batches,
+      local_chunk['ftag'],
+      local_chunk['hmap_dir'],
+      local_chunk['hdr_index'],
       local_chunk['fnames'],
       rank,
       local_chunk['dt'],
+      buffer_mb=local_chunk['buffer_mb'],
+      cache_files=local_chunk['cache_files'],
+      cache_mb=local_chunk['cache_mb'],
+      prefetch_depth=local_chunk['prefetch'],
+      resume=local_chunk['resume'],
+      live_only=local_chunk['live_only'],
+      total=total,
   )
 
 
@@ -244,18 +293,73 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument(
       "--src-hash-map",
       type=str,
-      default=root_dir + "segy/info_new/src_hmap.npy",
+      default=root_dir + "segy/info_new/src_hmap",
   )
   parser.add_argument(
       "--src-coords",
       type=str,
       default=root_dir + "segy/info_new/scoords.npy",
   )
+  parser.add_argument(
+      "--header-index",
+      type=str,
+      default=root_dir + "segy/info_new/hdr_index",
+  )
   parser.add_argument("--nxg", type=int, default=500)
   parser.add_argument("--nyg", type=int, default=500)
   parser.add_argument("--offset-x", type=int, default=0)
   parser.add_argument("--offset-y", type=int, default=0)
   parser.add_argument("--qc", action='store_true', default=False)
+  parser.add_argument(
+      "--schedule",
+      type=str,
+      choices=['static', 'dynamic', 'affinity'],
+      default='static',
+      help=("static splits the shots evenly over the ranks. dynamic hands "
+            "out batches of shots from rank 0 on demand. affinity keeps the "
+            "shots reading the same SEG-Y files on the same rank. dynamic "
+            "and affinity format the output names with (rank, size) "
+            "instead of (ymin, ymax)"),
+  )
+  parser.add_argument(
+      "--buffer-mb",
+      type=int,
+      default=512,
+      help="Size of the shot buffer of each rank before writing [MB]",
+  )
+  parser.add_argument(
+      "--cache-files",
+      type=int,
+      default=64,
+      help="Maximum number of SEG-Y files kept open by each rank",
+  )
+  parser.add_argument(
+      "--cache-mb",
+      type=int,
+      default=1024,
+      help="Maximum size of the cached trace headers [MB]",
+  )
+  parser.add_argument(
+      "--prefetch",
+      type=int,
+      default=0,
+      help=("Number of shots each rank reads ahead in a background thread "
+            "while writing. 0 reads and writes sequentially"),
+  )
+  parser.add_argument(
+      "--resume",
+      action='store_true',
+      default=False,
+      help=("Continue a previous run with the same ranks and outputs. Each "
+            "rank keeps a manifest of its completed shots next to its shot "
+            "file, skips them and truncates any partial writes"),
+  )
+  parser.add_argument(
+      "--drop-dead-traces",
+      action='store_true',
+      default=False,
+      help="Drop the dead traces of each shot before reading its data",
+  )
   parser.add_argument(
       "--img",
       type=str,
@@ -6,8 +6,9 @@ set -x
 
 mpirun --hostfile=hostfile.txt -np=32 \
   python scripts/select_data_all_parallel.py \
-  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap.npy \
+  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap \
   --src-coords=${ROOT_DIR}/segy/info_new/scoords.npy \
+  --header-index=${ROOT_DIR}/segy/info_new/hdr_index \
   --nxg=500 \
   --nyg=500 \
   --output-base-srcx-coords=${ROOT_DIR}/process_f3_data/windowed_data/all/f3_srcx_all_%d-%d.H \
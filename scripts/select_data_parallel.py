@@ -1,23 +1,29 @@
 import argparse
-import segyio
 import numpy as np
 from mpi4py import MPI
 from tqdm import tqdm
 import logging
 
-from regio import seppy
 from utils import chunks
+from shot_reader import ShotReader
+from spatial_index import NearestIndex
+from src_map import SourceMap
+from shot_writer import ShotWriter
 
 
 def _process_inline(
     sychunk,
     sxs,
     fcrds,
-    hmap,
+    hmap_dir,
+    hdr_index,
     fnames,
     rank,
     dt=0.002,
     logdir='./log',
+    buffer_mb=512,
+    cache_files=64,
+    cache_mb=1024,
 ):
 
   # Create a logger
@@ -27,31 +33,40 @@ def _process_inline(
       format='%(asctime)s - %(filename)s:%(lineno)d - %(message)s',
   )
 
-  # Write SEP files
-  sep = seppy.sep()
+  # Memory-mapped map from sources to SEG-Y files
+  hmap = SourceMap(hmap_dir)
+  # Reads shots using the trace header index
+  reader = ShotReader(
+      hdr_index,
+      max_files=cache_files,
+      max_bytes=cache_mb * 2**20,
+  )
 
-  dmap = {}
   srcs = set()
   rsxs, rsys = [], []
   nsy, nsx = len(sychunk), len(sxs)
   ymin, ymax = np.min(sychunk), np.max(sychunk)
   logging.info('Ymin: %d Ymax: %d' % (ymin, ymax))
+  # Buffers the selected shots and writes them in blocks
+  writer = ShotWriter(
+      {key: fname % (ymin, ymax) for key, fname in fnames.items()},
+      dt=dt,
+      max_bytes=buffer_mb * 2**20,
+  )
+  # Find the nearest source to each grid point
+  gsys, gsxs = np.meshgrid(sychunk, sxs, indexing='ij')
+  nidx = NearestIndex(fcrds).nearest(np.stack([gsys, gsxs], axis=-1))
+  nidx = nidx.reshape(nsy, nsx)
   with tqdm(total=nsy * nsx,
             desc='rank %d nshots' % (rank),
             position=rank + 1,
             nrows=40) as pbar:
     # Loop over chunks
     for isy in range(nsy):
-      gsy = sychunk[isy]
       for isx in range(nsx):
         pbar.update(1)
-        gsx = sxs[isx]
-        # Compute the distance between this point and
-        # all of the source coordinates
-        dists = np.sqrt((gsy - fcrds[:, 0])**2 + (gsx - fcrds[:, 1])**2)
-        # Find this coordinate
-        idx = np.argmin(dists)
-        rsy, rsx = fcrds[idx]
+        # Nearest source to this grid point
+        rsy, rsx = fcrds[nidx[isy, isx]]
         # If we have seen these source before, keep going
         if ((rsy, rsx) in srcs):
           logging.info("Saw %d %d before, not writing" % (rsy, rsx))
@@ -60,67 +75,16 @@ def _process_inline(
           srcs.add((rsy, rsx))
         rsys.append(rsy)
         rsxs.append(rsx)
-        # Get the key that tells us which files contain the data
-        key = str(int(rsy)) + ' ' + str(int(rsx))
-        recxinfo, recyinfo = [], []
-        strminfo, tidcinfo = [], []
-        srcdat = []
-        for ifile in hmap[key]:
-          if (ifile not in dmap):
-            dmap[ifile] = segyio.open(ifile, ignore_geometry=True)
-          # Get the source coordinates
-          srcxf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.SourceX),
-              dtype='int32',
-          )
-          srcyf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.SourceY),
-              dtype='int32',
-          )
-          # Get the receiver coordinates
-          recxf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.GroupX),
-              dtype='int32',
-          )
-          recyf = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.GroupY),
-              dtype='int32',
-          )
-          # Get the streamer header
-          strmr = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.CDP_TRACE),
-              dtype='int32',
-          )
-          # Get the trace identification code
-          tidcd = np.asarray(
-              dmap[ifile].attributes(segyio.TraceField.TraceIdentificationCode),
-              dtype='int32',
-          )
-          # Find the traces with that source coordinate
-          scoordsf = np.zeros([len(srcxf), 2], dtype='int32')
-          scoordsf[:, 0] = srcyf
-          scoordsf[:, 1] = srcxf
-          idx1 = scoordsf == fcrds[idx]
-          s = np.sum(idx1, axis=1)
-          nidx1 = s == 2
-          # Get receiver coordinates for this shot
-          recxinfo.append(recxf[nidx1])
-          recyinfo.append(recyf[nidx1])
-          # Get the streamer header for this shot
-          strminfo.append(strmr[nidx1])
-          # Get the trace identification codes for this shot
-          tidcinfo.append(tidcd[nidx1])
-          # Get the data for this shot
-          data = dmap[ifile].trace.raw[:]
-          srcdat.append(data[nidx1, :])
-        # Concatenate data from different files
-        recxinfo = np.concatenate(recxinfo, axis=0)
-        recyinfo = np.concatenate(recyinfo, axis=0)
-        strminfo = np.concatenate(strminfo, axis=0)
-        tidcinfo = np.concatenate(tidcinfo, axis=0)
-        srcdat = np.concatenate(srcdat, axis=0)
+        # Skip the shots with only dead traces before reading them
+        if reader.hidx.dead_mask(rsy, rsx):
+          logging.info("Bad shot, not reading shot %d %d" % (rsy, rsx))
+          continue
+        # Read only the traces of this shot
+        shot = reader.get_shot(rsy, rsx, hmap.lookup(rsy, rsx))
+        recyinfo, tidcinfo = shot['recy'], shot['tid']
+        srcdat = shot['data']
         ntr, nt = srcdat.shape
-        nrec = len(recxinfo)
+        nrec = shot['nrec']
         # Skip writing if dead traces
         if (np.all(tidcinfo == 2)):
           logging.info("Bad shot, not writing shot %d %d" % (rsy, rsx))
@@ -128,54 +92,13 @@ def _process_inline(
         # Add the tuple to the set and make sure we have not used it
         if (nrec != len(recyinfo)):
           logging.warning("Warning nrecx != nrecy for shot %f %f" % (rsy, rsx))
-        if (isy == 0 and isx == 0):
-          sep.write_file(fnames['srcx'] % (ymin, ymax), np.asarray([rsx]))
-          sep.write_file(fnames['srcy'] % (ymin, ymax), np.asarray([rsy]))
-          sep.write_file(
-              fnames['recx'] % (ymin, ymax),
-              recxinfo.astype('float32'),
-          )
-          sep.write_file(
-              fnames['recy'] % (ymin, ymax),
-              recyinfo.astype('float32'),
-          )
-          sep.write_file(
-              fnames['nrec'] % (ymin, ymax),
-              np.asarray([nrec], dtype='float32'),
-          )
-          sep.write_file(
-              fnames['streamer'] % (ymin, ymax),
-              strminfo.astype('float32'),
-          )
-          sep.write_file(
-              fnames['shots'] % (ymin, ymax),
-              srcdat.T,
-              ds=[dt, 1.0],
-          )
-        else:
-          sep.append_file(fnames['srcx'] % (ymin, ymax), np.asarray([rsx]))
-          sep.append_file(fnames['srcy'] % (ymin, ymax), np.asarray([rsy]))
-          sep.append_file(
-              fnames['recx'] % (ymin, ymax),
-              recxinfo.astype('float32'),
-          )
-          sep.append_file(
-              fnames['recy'] % (ymin, ymax),
-              recyinfo.astype('float32'),
-          )
-          sep.append_file(
-              fnames['nrec'] % (ymin, ymax),
-              np.asarray([nrec], dtype='float32'),
-          )
-          sep.append_file(
-              fnames['streamer'] % (ymin, ymax),
-              strminfo.astype('float32'),
-          )
-          sep.append_file(fnames['shots'] % (ymin, ymax), srcdat.T)
+        # Write traces to SEP files
+        writer.write(shot)
 
-  # Close all of the opened files
-  for kvp in dmap.items():
-    kvp[1].close()
+  # Write the remaining shots and close all of the opened files
+  writer.close()
+  logging.info(reader.cache.stats())
+  reader.close()
 
 
 def main(args):
@@ -185,8 +108,7 @@ def main(args):
   size = comm.Get_size()
 
   if rank == 0:
-    # Read in the source hash map and the source coordinates
-    hmap = np.load(args.src_hash_map, allow_pickle=True)[()]
+    # Read in the source coordinates
     crds = np.load(args.src_coords, allow_pickle=True)[()]
 
     # Grid origin and sampling of the original grid
@@ -231,9 +153,13 @@ def main(args):
         'sychunk': icnk,
         'sxs': sxs,
         'fcrds': fcrds,
-        'hmap': hmap,
+        'hmap_dir': args.src_hash_map,
+        'hdr_index': args.header_index,
         'fnames': fnames,
         'dt': dt,
+        'buffer_mb': args.buffer_mb,
+        'cache_files': args.cache_files,
+        'cache_mb': args.cache_mb,
     } for icnk in sychunks]
   else:
     allchunks = None
@@ -244,10 +170,14 @@ def main(args):
       local_chunk['sychunk'],
       local_chunk['sxs'],
       local_chunk['fcrds'],
-      local_chunk['hmap'],
+      local_chunk['hmap_dir'],
+      local_chunk['hdr_index'],
       local_chunk['fnames'],
       rank,
       local_chunk['dt'],
+      buffer_mb=local_chunk['buffer_mb'],
+      cache_files=local_chunk['cache_files'],
+      cache_mb=local_chunk['cache_mb'],
   )
 
 
@@ -256,13 +186,18 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument(
       "--src-hash-map",
       type=str,
-      default=root_dir + "segy/info_new/src_hmap.npy",
+      default=root_dir + "segy/info_new/src_hmap",
   )
   parser.add_argument(
       "--src-coords",
       type=str,
       default=root_dir + "segy/info_new/scoords.npy",
   )
+  parser.add_argument(
+      "--header-index",
+      type=str,
+      default=root_dir + "segy/info_new/hdr_index",
+  )
   parser.add_argument("--dsx", type=float, default=100)
   parser.add_argument("--dsy", type=float, default=100)
   parser.add_argument("--nxg", type=int, default=500)
@@ -270,6 +205,24 @@ def attach_args(parser=argparse.ArgumentParser()):
   parser.add_argument("--offset-x", type=int, default=0)
   parser.add_argument("--offset-y", type=int, default=0)
   parser.add_argument("--qc", action='store_true', default=False)
+  parser.add_argument(
+      "--buffer-mb",
+      type=int,
+      default=512,
+      help="Size of the shot buffer before writing [MB]",
+  )
+  parser.add_argument(
+      "--cache-files",
+      type=int,
+      default=64,
+      help="Maximum number of SEG-Y files kept open by each rank",
+  )
+  parser.add_argument(
+      "--cache-mb",
+      type=int,
+      default=1024,
+      help="Maximum size of the cached trace headers [MB]",
+  )
   parser.add_argument(
       "--img",
       type=str,
@@ -6,8 +6,9 @@ set -x
 
 mpirun --hostfile=hostfile.txt -np=32 \
   python scripts/select_data_parallel.py \
-  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap.npy \
+  --src-hash-map=${ROOT_DIR}/segy/info_new/src_hmap \
   --src-coords=${ROOT_DIR}/segy/info_new/scoords.npy \
+  --header-index=${ROOT_DIR}/segy/info_new/hdr_index \
   --dsx=100 \
   --dsy=50  \
   --nxg=500 \
@@ -0,0 +1,158 @@
+import os
+import numpy as np
+from contextlib import nullcontext
+
+
+def read_header_pars(fname) -> dict:
+  """
+  Reads the parameters of a SEP header file
+
+  Later definitions of a parameter override earlier ones
+
+  Parameters:
+    fname - path to the SEP header (.H) file
+
+  Returns a dictionary of the header parameters (as strings)
+  """
+  pars = {}
+  with open(fname, 'r') as f:
+    for line in f:
+      for tok in line.split():
+        if '=' in tok:
+          key, val = tok.split('=', 1)
+          pars[key] = val.strip('"').strip("'")
+  return pars
+
+
+def sep_binary(fname) -> str:
+  """ Returns the path of the binary file of a SEP header """
+  binary = read_header_pars(fname)['in']
+  if not os.path.isabs(binary):
+    binary = os.path.join(os.path.dirname(os.path.abspath(fname)), binary)
+  return binary
+
+
+def read_axes(fname):
+  """
+  Reads the axes of a SEP file from its header
+
+  Trailing axes of length one are dropped (at least one axis is kept)
+
+  Parameters:
+    fname - path to the SEP header (.H) file
+
+  Returns the lists of the lengths, origins and samplings of the axes
+  """
+  pars = read_header_pars(fname)
+  n, o, d = [], [], []
+  iaxis = 1
+  while 'n%d' % iaxis in pars:
+    n.append(int(pars['n%d' % iaxis]))
+    o.append(float(pars.get('o%d' % iaxis, 0.0)))
+    d.append(float(pars.get('d%d' % iaxis, 1.0)))
+    iaxis += 1
+  while len(n) > 1 and n[-1] == 1:
+    n, o, d = n[:-1], o[:-1], d[:-1]
+  return n, o, d
+
+
+def write_header(fname, n, o, d, binary, data_format='xdr_float', esize=4):
+  """
+  Writes a SEP header file for an existing binary file
+
+  The binary is recorded by its absolute path so the header can be read
+  from any directory
+  """
+  with open(fname, 'w') as f:
+    for iaxis in range(len(n)):
+      f.write('n%d=%d o%d=%g d%d=%g\n' %
+              (iaxis + 1, n[iaxis], iaxis + 1, o[iaxis], iaxis + 1, d[iaxis]))
+    f.write('in="%s"\n' % (os.path.abspath(binary)))
+    f.write('data_format="%s" esize=%d\n' % (data_format, esize))
+
+
+def copy_bytes(src, fdst, nbytes=None, block=64 * 2**20, offset=0):
+  """
+  Appends a range of bytes of a file to an open file in blocks
+
+  Uses os.copy_file_range when available so the bytes are copied by the
+  kernel and never pass through user space
+
+  Parameters:
+    src    - path to the source file or source file opened in binary mode
+    fdst   - destination file opened in binary write mode
+    nbytes - number of bytes to copy [rest of the file]
+    block  - size of each copied block [64 MB]
+    offset - position of the first copied byte in src [0]
+  """
+  fdst.flush()
+  if isinstance(src, (str, bytes, os.PathLike)):
+    fopen = open(src, 'rb')
+  else:
+    fopen = nullcontext(src)
+  with fopen as fsrc:
+    nleft = os.fstat(fsrc.fileno()).st_size - offset
+    fsrc.seek(offset)
+    if nbytes is not None:
+      if nbytes > nleft:
+        raise ValueError("%s has %d bytes, expected %d" %
+                         (fsrc.name, nleft, nbytes))
+      nleft = nbytes
+    if hasattr(os, 'copy_file_range'):
+      try:
+        while nleft > 0:
+          ncopy = os.copy_file_range(fsrc.fileno(), fdst.fileno(),
+                                     min(block, nleft))
+          if ncopy == 0:
+            break
+          nleft -= ncopy
+      except OSError:
+        # Not supported between these file systems
+        pass
+    # Resume after the bytes copied by the kernel
+    fsrc.seek(os.lseek(fsrc.fileno(), 0, os.SEEK_CUR))
+    while nleft > 0:
+      buf = fsrc.read(min(block, nleft))
+      if len(buf) == 0:
+        break
+      fdst.write(buf)
+      nleft -= len(buf)
+  fdst.flush()
+
+
+def concat_files(fnames, output, block=64 * 2**20):
+  """
+  Concatenates SEP files along their slowest axis without reading them
+
+  The binary files are copied as bytes and only a new header is written.
+  All files must have the same data format and the same lengths of all
+  axes but the slowest. The origins and samplings of the first file are kept
+
+  Parameters:
+    fnames - paths to the SEP header files (in output order)
+    output - path to the output SEP header file (binary written to output@)
+    block  - size of each copied block [64 MB]
+  """
+  axes = [read_axes(fname) for fname in fnames]
+  ndim = max(len(n) for n, _, _ in axes)
+  ns = [n + [1] * (ndim - len(n)) for n, _, _ in axes]
+  for fname, n in zip(fnames, ns):
+    if n[:-1] != ns[0][:-1]:
+      raise ValueError("Axes of %s %s do not match %s %s" %
+                       (fname, n, fnames[0], ns[0]))
+  pars = read_header_pars(fnames[0])
+  data_format = pars.get('data_format', 'xdr_float')
+  esize = int(pars.get('esize', 4))
+  for fname in fnames:
+    if read_header_pars(fname).get('data_format', 'xdr_float') != data_format:
+      raise ValueError("Data format of %s differs from %s" %
+                       (fname, fnames[0]))
+  binary = output + '@'
+  with open(binary, 'wb') as fdst:
+    for fname, n in zip(fnames, ns):
+      copy_bytes(sep_binary(fname), fdst, int(np.prod(n)) * esize, block)
+  _, o, d = axes[0]
+  o = o + [0.0] * (ndim - len(o))
+  d = d + [1.0] * (ndim - len(d))
+  n = ns[0][:-1] + [sum(nf[-1] for nf in ns)]
+  write_header(output, n, o, d, binary, data_format, esize)
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+from regio import seppy
+
+# Output files written by select_data_all_parallel.py for each rank
+DATASET_KEYS = ('f3_shots', 'f3_srcx', 'f3_srcy', 'f3_recx', 'f3_recy',
+                'f3_nrec', 'f3_strm')
+
+
+def rank_suffixes(data_dir, exclude='_all_combined'):
+  """
+  Finds the per-rank outputs of a data directory
+
+  Parameters:
+    data_dir - directory containing the per-rank SEP files
+    exclude  - skip the files containing this string [_all_combined]
+
+  Returns the sorted suffixes of the per-rank files (after 'f3_shots')
+  """
+  return sorted([
+      ifile.split('f3_shots')[-1]
+      for ifile in os.listdir(data_dir)
+      if ifile.startswith('f3_shots') and ifile.endswith('.H') and
+      exclude not in ifile
+  ])
+
+
+class ShotDataset:
+  """
+  Presents the per-rank outputs of the shot selection as a single
+  collection of shots without combining them
+
+  The shots of all of the files are indexed globally in file order (the
+  order of combine_ranks.py). Reads of a range of shots are windowed reads
+  of the files that hold them
+  """
+
+  def __init__(self, data_dir, sep=None):
+    """
+    ShotDataset constructor
+
+    Parameters:
+      data_dir - directory containing the per-rank SEP files
+      sep      - seppy.sep object used for reading [new object]
+    """
+    self.data_dir = data_dir
+    self.sep = seppy.sep() if sep is None else sep
+    self.suffixes = rank_suffixes(data_dir)
+    if len(self.suffixes) == 0:
+      raise ValueError("No per-rank shot files found in %s" % (data_dir))
+    # Per-shot headers of all files
+    srcx, srcy, nrec, nshots = [], [], [], [0]
+    for suffix in self.suffixes:
+      srcx.append(self.__read('f3_srcx', suffix))
+      srcy.append(self.__read('f3_srcy', suffix))
+      nrec.append(self.__read('f3_nrec', suffix).astype('int64'))
+      nshots.append(len(nrec[-1]))
+    self.srcx = np.concatenate(srcx)
+    self.srcy = np.concatenate(srcy)
+    self.nrec = np.concatenate(nrec)
+    # Global index of the first shot of each file
+    self.file_shots = np.cumsum(nshots)
+    # Global index of the first trace of each shot
+    self.first_trace = np.zeros(len(self.nrec) + 1, dtype='int64')
+    np.cumsum(self.nrec, out=self.first_trace[1:])
+    # Time axis of the shots
+    daxes = self.sep.read_header(self.__name('f3_shots', self.suffixes[0]))
+    self.o, self.d = daxes.o, daxes.d
+    self.nt, self.dt = daxes.n[0], daxes.d[0]
+
+  def __name(self, key, suffix):
+    return os.path.join(self.data_dir, key + suffix)
+
+  def __read(self, key, suffix):
+    _, data = self.sep.read_file(self.__name(key, suffix))
+    return data
+
+  def __len__(self):
+    return len(self.nrec)
+
+  def locate(self, ishot):
+    """ Returns the file index and the index within the file of a shot """
+    if ishot < 0 or ishot >= len(self):
+      raise IndexError("Shot %d out of range [0, %d)" % (ishot, len(self)))
+    ifile = int(np.searchsorted(self.file_shots, ishot, side='right')) - 1
+    return ifile, ishot - int(self.file_shots[ifile])
+
+  def read_shots(self, beg, end) -> dict:
+    """
+    Reads the shots [beg, end), which may span several files
+
+    Returns a dictionary with the DATASET_KEYS fields of the shots
+    (f3_shots is [ntr,nt] and f3_nrec is int32)
+    """
+    beg, end = max(beg, 0), min(end, len(self))
+    odict = {
+        'f3_srcx': self.srcx[beg:end],
+        'f3_srcy': self.srcy[beg:end],
+        'f3_nrec': self.nrec[beg:end].astype('int32'),
+    }
+    trcs = {'f3_shots': [], 'f3_recx': [], 'f3_recy': [], 'f3_strm': []}
+    for ifile, suffix in enumerate(self.suffixes):
+      fbeg = max(beg, self.file_shots[ifile])
+      fend = min(end, self.file_shots[ifile + 1])
+      if fend <= fbeg:
+        continue
+      # Trace window of the shots within this file
+      ftr = self.first_trace[self.file_shots[ifile]]
+      fw = int(self.first_trace[fbeg] - ftr)
+      nw = int(self.first_trace[fend] - self.first_trace[fbeg])
+      if nw == 0:
+        continue
+      for key in trcs:
+        daxes, data = self.sep.read_wind(self.__name(key, suffix), fw=fw, nw=nw)
+        if key == 'f3_shots':
+          data = data.reshape(daxes.n, order='F').T
+        trcs[key].append(data)
+    for key, data in trcs.items():
+      if len(data) > 0:
+        odict[key] = np.concatenate(data, axis=0)
+      elif key == 'f3_shots':
+        odict[key] = np.zeros([0, self.nt], dtype='float32')
+      else:
+        odict[key] = np.zeros(0, dtype='float32')
+    return odict
+
+  def __getitem__(self, ishot) -> dict:
+    """ Reads a single shot """
+    self.locate(ishot)
+    return self.read_shots(ishot, ishot + 1)
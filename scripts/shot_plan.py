@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def affinity_chunks(fileids, costs, nchnks):
+  """
+  Splits shots into chunks so that the shots reading the same SEG-Y files
+  end up in the same chunk
+
+  Shots are grouped by the set of files they span and the groups are
+  ordered by their files. The ordered groups are then cut into nchnks
+  contiguous chunks of nearly equal cost, only at group boundaries. This is
+  a locality heuristic, not a bound: groups sharing a file are usually
+  neighbors in that order, but a file can still be read by several chunks
+  (e.g., a file with more shots than a chunk, or a group [0,5] ordered far
+  from the group [5])
+
+  Parameters:
+    fileids - list of the (sorted) file ids spanned by each shot
+    costs   - estimated cost of each shot [nshots]
+    nchnks  - number of chunks
+
+  Returns a list of nchnks lists of shot indices
+  """
+  # Group shots by the files they span
+  groups = {}
+  for k, ifiles in enumerate(fileids):
+    groups.setdefault(tuple(sorted(ifiles)), []).append(k)
+  keys = sorted(groups.keys())
+  gcosts = np.asarray([sum(costs[k] for k in groups[key]) for key in keys])
+  # Cut the ordered groups where the cumulative cost crosses each share
+  ccosts = np.cumsum(gcosts)
+  total = ccosts[-1] if len(keys) > 0 else 0
+  shares = total * np.arange(1, nchnks) / nchnks
+  cuts = np.searchsorted(ccosts, shares, side='left') + 1
+  bounds = np.concatenate([[0], np.minimum(cuts, len(keys)), [len(keys)]])
+  return [[k for key in keys[bounds[i]:bounds[i + 1]] for k in groups[key]]
+          for i in range(nchnks)]
+
+
+def shared_files(chnks_fileids):
+  """
+  Counts the files read by more than one chunk
+
+  Parameters:
+    chnks_fileids - for each chunk, the list of file ids of each of its shots
+
+  Returns the number of files read by more than one chunk
+  """
+  readers = {}
+  for ichnk, cfileids in enumerate(chnks_fileids):
+    for ifile in set(ifile for ifiles in cfileids for ifile in ifiles):
+      readers[ifile] = readers.get(ifile, 0) + 1
+  return sum(1 for nrd in readers.values() if nrd > 1)
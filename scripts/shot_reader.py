@@ -0,0 +1,273 @@
+from collections import OrderedDict
+import numpy as np
+
+from header_index import HeaderIndex, HDR_DTYPE, DEAD_TID
+from utils import KeyIndex
+
+# Big-endian sample types of the supported SEG-Y sample formats.
+# IBM floats are read as raw words and converted after reading
+SAMPLE_DTYPES = {
+    1: '>u4',
+    2: '>i4',
+    3: '>i2',
+    5: '>f4',
+    8: 'i1',
+}
+
+TRACE_HDR_SIZE = 240
+
+# Trace header fields returned with each shot
+SHOT_HDR_FIELDS = {
+    'recx': 'recx',
+    'recy': 'recy',
+    'streamer': 'strm',
+    'tid': 'tid',
+}
+
+
+def ibm2ieee(ibm, out=None) -> np.ndarray:
+  """
+  Converts an array of IBM 4-byte float words to IEEE float32
+
+  Parameters:
+    ibm - IBM float words
+    out - optional float32 output array with the shape of ibm
+
+  Returns the converted array (out if given)
+  """
+  ibm = np.asarray(ibm, dtype='uint32')
+  if out is None:
+    out = np.empty(ibm.shape, dtype='float32')
+  sign = np.where(ibm >> 31, -1.0, 1.0)
+  expn = ((ibm >> 24) & 0x7f).astype('int32')
+  frac = (ibm & 0x00ffffff).astype('float64')
+  np.multiply(sign, np.ldexp(frac, 4 * (expn - 64) - 24), out=out,
+              casting='same_kind')
+  return out
+
+
+def trace_ranges(idx) -> np.ndarray:
+  """
+  Splits sorted trace indices into runs of contiguous traces
+
+  Parameters:
+    idx - sorted trace indices [ntr]
+
+  Returns an array [nrun, 2] of the [beg, end) trace range of each run
+  """
+  idx = np.asarray(idx, dtype='int64')
+  if len(idx) == 0:
+    return np.zeros([0, 2], dtype='int64')
+  brks = np.flatnonzero(np.diff(idx) != 1) + 1
+  begs = np.concatenate([idx[:1], idx[brks]])
+  ends = np.concatenate([idx[brks - 1], idx[-1:]]) + 1
+  return np.stack([begs, ends], axis=1)
+
+
+class SegyTraces:
+  """ Memory-mapped view of the traces of a SEG-Y file """
+
+  def __init__(self, path, ntr, data_offset, ns, fmt):
+    """
+    SegyTraces constructor
+
+    Parameters:
+      path        - path to the SEG-Y file
+      ntr         - number of traces in the file
+      data_offset - byte offset of the first trace header
+      ns          - number of samples per trace
+      fmt         - SEG-Y sample format code
+    """
+    if fmt not in SAMPLE_DTYPES:
+      raise ValueError("Unsupported SEG-Y sample format %d in %s" % (fmt, path))
+    self.fmt = fmt
+    self.ns = ns
+    trdtype = np.dtype([
+        ('hdr', 'V%d' % TRACE_HDR_SIZE),
+        ('data', SAMPLE_DTYPES[fmt], (ns,)),
+    ])
+    self.__mm = np.memmap(
+        path,
+        dtype=trdtype,
+        mode='r',
+        offset=data_offset,
+        shape=(ntr,),
+    )
+
+  def read(self, beg, end, out=None) -> np.ndarray:
+    """
+    Reads the samples of traces [beg, end) as float32 [end-beg, ns]
+
+    The samples are converted directly into out if it is given
+    """
+    raw = self.__mm['data'][beg:end]
+    if self.fmt == 1:
+      return ibm2ieee(raw, out)
+    if out is None:
+      return raw.astype('float32')
+    out[...] = raw
+    return out
+
+  def close(self):
+    """ Releases the memory map (unmapped once no views remain) """
+    self.__mm = None
+
+  @property
+  def closed(self) -> bool:
+    return self.__mm is None
+
+
+class FileCache:
+  """
+  LRU cache of opened SEG-Y files and their decoded trace headers
+
+  The least recently used files are closed once the cache holds more than
+  max_files files or more than max_bytes of decoded headers
+  """
+
+  def __init__(self, load, max_files=64, max_bytes=2**30):
+    """
+    FileCache constructor
+
+    Parameters:
+      load      - function returning the (traces, headers, keys) of a file
+      max_files - maximum number of opened files [64]
+      max_bytes - maximum size of the cached headers [1 GB]
+    """
+    self.load = load
+    self.max_files = max_files
+    self.max_bytes = max_bytes
+    self.nbytes = 0
+    self.hits, self.misses, self.evictions = 0, 0, 0
+    self.__entries = OrderedDict()
+
+  def __len__(self):
+    return len(self.__entries)
+
+  def get(self, segy):
+    """ Returns the (traces, headers, keys) of a SEG-Y file """
+    if segy in self.__entries:
+      self.hits += 1
+      self.__entries.move_to_end(segy)
+      return self.__entries[segy]
+    self.misses += 1
+    entry = self.load(segy)
+    self.__entries[segy] = entry
+    self.nbytes += self.__nbytes(entry)
+    # Always keep the requested file
+    while len(self.__entries) > 1 and (len(self.__entries) > self.max_files or
+                                       self.nbytes > self.max_bytes):
+      self.evict()
+    return entry
+
+  def evict(self):
+    """ Closes the least recently used file """
+    _, entry = self.__entries.popitem(last=False)
+    entry[0].close()
+    self.nbytes -= self.__nbytes(entry)
+    self.evictions += 1
+
+  @staticmethod
+  def __nbytes(entry):
+    return sum(item.nbytes for item in entry[1:])
+
+  def clear(self):
+    """ Closes all of the files """
+    while len(self.__entries) > 0:
+      self.evict()
+
+  def stats(self) -> str:
+    """ Returns a summary of the cache counters """
+    return "file cache: %d hits, %d misses, %d evictions" % (
+        self.hits, self.misses, self.evictions)
+
+
+class ShotReader:
+  """ Reads shot gathers from SEG-Y files using a header index """
+
+  def __init__(self, hdr_index, max_files=64, max_bytes=2**30):
+    """
+    ShotReader constructor
+
+    Parameters:
+      hdr_index - directory of the header index (see make_header_index.py)
+      max_files - maximum number of files kept open [64]
+      max_bytes - maximum size of the cached trace headers [1 GB]
+    """
+    self.hidx = HeaderIndex(hdr_index)
+    self.cache = FileCache(self.__open, max_files, max_bytes)
+
+  def __open(self, segy):
+    """ Opens the traces of a SEG-Y file and indexes its trace headers """
+    row = self.hidx.row(segy)
+    traces = SegyTraces(
+        segy,
+        row['ntr'],
+        row['data_offset'],
+        row['ns'],
+        row['format'],
+    )
+    hdrs = self.hidx.read(segy)
+    return traces, hdrs, KeyIndex(hdrs['srcy'], hdrs['srcx'])
+
+  def traces(self, segy) -> SegyTraces:
+    """ Returns the memory-mapped traces of a SEG-Y file """
+    return self.cache.get(segy)[0]
+
+  def get_shot(self, srcy, srcx, files, live_only=False) -> dict:
+    """
+    Reads a shot gather from the SEG-Y files containing its traces
+
+    Only the contiguous trace ranges of the shot are read from each file.
+    The traces are read directly into a single preallocated shot buffer
+
+    Parameters:
+      srcy      - y source coordinate of the shot
+      srcx      - x source coordinate of the shot
+      files     - SEG-Y files containing traces of the shot
+      live_only - drop the dead traces before reading the data [False]
+
+    Returns a dictionary of the shot headers and its data [ntr,nt]
+    """
+    # Find the traces of the shot in each file
+    parts = []
+    for ifile in files:
+      traces, hdrs, keys = self.cache.get(ifile)
+      idx = keys.find(srcy, srcx)
+      if live_only:
+        idx = idx[hdrs['tid'][idx] != DEAD_TID]
+      parts.append((ifile, traces, hdrs, idx))
+    ntr = sum(len(idx) for _, _, _, idx in parts)
+    ns = parts[0][1].ns
+    # Allocate the shot once and fill it file by file
+    shot = {
+        'srcx': srcx,
+        'srcy': srcy,
+        'recx': np.empty(ntr, dtype=HDR_DTYPE['recx']),
+        'recy': np.empty(ntr, dtype=HDR_DTYPE['recy']),
+        'nrec': ntr,
+        'streamer': np.empty(ntr, dtype=HDR_DTYPE['strm']),
+        'tid': np.empty(ntr, dtype=HDR_DTYPE['tid']),
+        'data': np.empty([ntr, ns], dtype='float32'),
+    }
+    itr = 0
+    for ifile, traces, hdrs, idx in parts:
+      if traces.closed:
+        # Evicted while the other files of the shot were opened
+        traces = self.cache.get(ifile)[0]
+      if traces.ns != ns:
+        raise ValueError("Shot %d %d spans files with %d and %d samples" %
+                         (srcy, srcx, ns, traces.ns))
+      nidx = len(idx)
+      # Get the headers for this shot
+      for key, field in SHOT_HDR_FIELDS.items():
+        np.take(hdrs[field], idx, out=shot[key][itr:itr + nidx])
+      # Read only the traces of this shot
+      for beg, end in trace_ranges(idx):
+        traces.read(beg, end, out=shot['data'][itr:itr + end - beg])
+        itr += end - beg
+    return shot
+
+  def close(self):
+    """ Closes all of the opened files """
+    self.cache.clear()
@@ -0,0 +1,168 @@
+import os
+import json
+import numpy as np
+
+from sep_io import write_header
+
+# Output files written for each shot
+SHOT_KEYS = ('srcx', 'srcy', 'recx', 'recy', 'nrec', 'streamer', 'shots')
+
+# Outputs with one value per trace (the others have one value per shot)
+TRACE_KEYS = ('recx', 'recy', 'streamer', 'shots')
+
+
+def read_manifest(fname):
+  """ Reads a progress manifest. Returns None if it does not exist """
+  if not os.path.exists(fname):
+    return None
+  with open(fname, 'r') as f:
+    return json.load(f)
+
+
+class ShotWriter:
+  """
+  Buffers shot gathers in memory and writes them to SEP files in blocks
+
+  The binary files (the header names with an '@' appended) stay open and
+  each flush appends to them. The SEP headers are written once by close
+  """
+
+  def __init__(
+      self,
+      fnames,
+      dt=0.002,
+      max_bytes=512 * 2**20,
+      manifest=None,
+      resume=False,
+  ):
+    """
+    ShotWriter constructor
+
+    Parameters:
+      fnames    - dictionary of output SEP file names for each of SHOT_KEYS
+      dt        - temporal sampling of the shots [0.002]
+      max_bytes - size of the buffered shots that triggers a flush [512 MB]
+      manifest  - progress manifest rewritten after each flush [None]
+      resume    - continue the outputs recorded in the manifest [False]
+    """
+    self.fnames = fnames
+    self.binaries = {key: fnames[key] + '@' for key in SHOT_KEYS}
+    self.dt = dt
+    self.max_bytes = max_bytes
+    self.manifest = manifest
+    self.nshots = 0
+    self.ntraces = 0
+    self.nt = None
+    # Shots done (written or skipped) and saved in the outputs
+    self.done = set()
+    self.__pending = []
+    self.__bufs = {key: [] for key in SHOT_KEYS}
+    self.__nbytes = 0
+    self.__files = None
+    if resume and manifest is not None:
+      self.__resume(read_manifest(manifest))
+
+  def __resume(self, mdict):
+    """ Discards everything written after the last manifest """
+    if mdict is None:
+      return
+    self.nshots, self.ntraces = mdict['nshots'], mdict['ntraces']
+    self.nt = mdict.get('nt')
+    self.done = set(tuple(crd) for crd in mdict['done'])
+    if self.nshots == 0:
+      return
+    # Truncate the binaries to discard partial appends
+    self.__files = {}
+    for key in SHOT_KEYS:
+      self.__files[key] = open(self.binaries[key], 'r+b')
+      self.__files[key].truncate(mdict['sizes'][key])
+      self.__files[key].seek(0, os.SEEK_END)
+
+  def write(self, ddict):
+    """
+    Adds a shot to the buffer and flushes the buffer if it is full
+
+    Parameters:
+      ddict - shot dictionary as returned by ShotReader.get_shot
+    """
+    self.__bufs['srcx'].append(np.asarray([ddict['srcx']], dtype='float32'))
+    self.__bufs['srcy'].append(np.asarray([ddict['srcy']], dtype='float32'))
+    self.__bufs['recx'].append(np.asarray(ddict['recx'], dtype='float32'))
+    self.__bufs['recy'].append(np.asarray(ddict['recy'], dtype='float32'))
+    self.__bufs['nrec'].append(np.asarray([ddict['nrec']], dtype='float32'))
+    self.__bufs['streamer'].append(
+        np.asarray(ddict['streamer'], dtype='float32'))
+    self.__bufs['shots'].append(np.asarray(ddict['data'], dtype='float32'))
+    self.__pending.append((float(ddict['srcy']), float(ddict['srcx'])))
+    self.__nbytes += sum(buf[-1].nbytes for buf in self.__bufs.values())
+    if self.__nbytes >= self.max_bytes:
+      self.flush()
+
+  def skip(self, srcy, srcx):
+    """ Marks a shot as done without writing it """
+    self.__pending.append((float(srcy), float(srcx)))
+
+  def flush(self):
+    """ Writes all buffered shots to the SEP files """
+    nbuf = len(self.__bufs['nrec'])
+    if nbuf > 0:
+      ntr = sum(len(recx) for recx in self.__bufs['recx'])
+      if self.__files is None:
+        self.__files = {
+            key: open(self.binaries[key], 'wb') for key in SHOT_KEYS
+        }
+      self.nt = self.__bufs['shots'][-1].shape[1]
+      for key in SHOT_KEYS:
+        # Big-endian (xdr_float). The shots [ntr,nt] are the traces of a
+        # [nt,ntr] Fortran ordered SEP file. Each buffered array is written
+        # as is (no copy of the whole buffer)
+        for data in self.__bufs[key]:
+          data.astype('>f4', copy=False).tofile(self.__files[key])
+        self.__files[key].flush()
+        self.__bufs[key] = []
+      self.nshots += nbuf
+      self.ntraces += ntr
+      self.__nbytes = 0
+    self.done.update(self.__pending)
+    self.__pending = []
+    self.__write_manifest()
+
+  def __write_manifest(self):
+    """ Records the shots done and the sizes of the outputs """
+    if self.manifest is None:
+      return
+    sizes = {}
+    if self.__files is not None:
+      sizes = {key: self.__files[key].tell() for key in SHOT_KEYS}
+    mdict = {
+        'nshots': self.nshots,
+        'ntraces': self.ntraces,
+        'nt': self.nt,
+        'sizes': sizes,
+        'done': sorted(self.done),
+    }
+    # Replace the manifest atomically so a crash never leaves it partial
+    tmp = self.manifest + '.tmp'
+    with open(tmp, 'w') as f:
+      json.dump(mdict, f)
+    os.replace(tmp, self.manifest)
+
+  def write_headers(self):
+    """ Writes the SEP headers of the shots written so far """
+    for key in SHOT_KEYS:
+      n = self.ntraces if key in TRACE_KEYS else self.nshots
+      if key == 'shots':
+        write_header(self.fnames[key], [self.nt, n], [0.0, 0.0],
+                     [self.dt, 1.0], self.binaries[key])
+      else:
+        write_header(self.fnames[key], [n], [0.0], [1.0], self.binaries[key])
+
+  def close(self):
+    """ Flushes the remaining shots and writes the SEP headers """
+    self.flush()
+    if self.__files is None:
+      return
+    for f in self.__files.values():
+      f.close()
+    self.__files = None
+    self.write_headers()
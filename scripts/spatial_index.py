@@ -0,0 +1,40 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class NearestIndex:
+  """ KD-tree for nearest-point queries over 2D coordinates """
+
+  def __init__(self, crds, ntie=4):
+    """
+    NearestIndex constructor
+
+    Parameters:
+      crds - input coordinates [npts,2] (e.g., (srcy,srcx) from scoords.npy)
+      ntie - number of neighbors compared to resolve ties [4]
+    """
+    crds = np.asarray(crds, dtype='float64')
+    if crds.ndim != 2 or crds.shape[1] != 2 or len(crds) == 0:
+      raise ValueError("crds must be a non-empty [npts,2] array")
+    # Repeated coordinates resolve to their first (lowest) index
+    ucrds, self.first = np.unique(crds, axis=0, return_index=True)
+    self.tree = cKDTree(ucrds)
+    self.ntie = min(ntie, len(ucrds))
+
+  def nearest(self, pts) -> np.ndarray:
+    """
+    Finds the nearest point in the index for each query point
+
+    Ties are resolved in favor of the lowest point index (as np.argmin)
+
+    Parameters:
+      pts - query coordinates [nqry,2]
+
+    Returns the indices [nqry] of the nearest points in crds
+    """
+    pts = np.asarray(pts, dtype='float64').reshape(-1, 2)
+    dist, idx = self.tree.query(pts, k=self.ntie)
+    dist, idx = dist.reshape(len(pts), -1), idx.reshape(len(pts), -1)
+    # Lowest index among the neighbors as close as the nearest one
+    cand = np.where(dist == dist[:, :1], self.first[idx], np.iinfo('int64').max)
+    return np.min(cand, axis=1)
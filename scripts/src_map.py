@@ -0,0 +1,83 @@
+import os
+import numpy as np
+
+from utils import pack_coords
+
+# Files making up a source map directory
+MAP_FILES = ('keys', 'offsets', 'fileids', 'files')
+
+
+def write_source_map(hmap_dir, srcy, srcx, fileids, files):
+  """
+  Writes the map from source coordinates to the SEG-Y files recording them
+
+  The map is stored in CSR form: the sorted packed source keys, the
+  offsets of each key into the file id table and the SEG-Y file names
+
+  Parameters:
+    hmap_dir - output directory of the source map
+    srcy     - y source coordinate of each (source, file) pair [npair]
+    srcx     - x source coordinate of each (source, file) pair [npair]
+    fileids  - index into files of each (source, file) pair [npair]
+    files    - list of SEG-Y file names
+  """
+  if not os.path.isdir(hmap_dir):
+    os.mkdir(hmap_dir)
+  pkeys = pack_coords(srcy, srcx)
+  fileids = np.asarray(fileids, dtype='int32')
+  # Sort by source and then by file
+  order = np.lexsort((fileids, pkeys))
+  pkeys, fileids = pkeys[order], fileids[order]
+  keys, cts = np.unique(pkeys, return_counts=True)
+  offsets = np.zeros(len(keys) + 1, dtype='int64')
+  np.cumsum(cts, out=offsets[1:])
+  np.save(os.path.join(hmap_dir, 'keys.npy'), keys)
+  np.save(os.path.join(hmap_dir, 'offsets.npy'), offsets)
+  np.save(os.path.join(hmap_dir, 'fileids.npy'), fileids)
+  np.save(os.path.join(hmap_dir, 'files.npy'), np.asarray(files, dtype='U512'))
+
+
+class SourceMap:
+  """ Read-only, memory-mapped map from source coordinates to SEG-Y files """
+
+  def __init__(self, hmap_dir):
+    """
+    SourceMap constructor
+
+    Parameters:
+      hmap_dir - directory of the source map (see make_hmap_scoordfile.py)
+    """
+    self.hmap_dir = hmap_dir
+    arrs = {
+        name: np.load(os.path.join(hmap_dir, name + '.npy'), mmap_mode='r')
+        for name in MAP_FILES
+    }
+    self.keys, self.offsets = arrs['keys'], arrs['offsets']
+    self.fileids = arrs['fileids']
+    self.files = arrs['files'].tolist()
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __contains__(self, crd):
+    return self.find(*crd) >= 0
+
+  def find(self, srcy, srcx) -> int:
+    """ Returns the position of a source in the map (-1 if not found) """
+    key = pack_coords(srcy, srcx)
+    pos = int(np.searchsorted(self.keys, key))
+    if pos < len(self.keys) and self.keys[pos] == key:
+      return pos
+    return -1
+
+  def file_ids(self, srcy, srcx) -> np.ndarray:
+    """ Returns the ids of the SEG-Y files recording a source """
+    pos = self.find(srcy, srcx)
+    if pos < 0:
+      raise KeyError("Source %d %d is not in the map %s" %
+                     (srcy, srcx, self.hmap_dir))
+    return self.fileids[self.offsets[pos]:self.offsets[pos + 1]]
+
+  def lookup(self, srcy, srcx) -> list:
+    """ Returns the SEG-Y files recording a source """
+    return [self.files[ifile] for ifile in self.file_ids(srcy, srcx)]
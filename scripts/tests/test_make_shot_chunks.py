@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('regio')
+pytest.importorskip('adf.gradopt.utils')
+
+from make_shot_chunks import chunk_bounds
+
+
+def _loop_bounds(nrec, chunk_size):
+  """ Chunk bounds of the original sequential loop """
+  nchunks = int(len(nrec) / chunk_size + 0.5)
+  bounds = []
+  begsht, endsht, begtr, endtr = 0, chunk_size, 0, 0
+  for _ in range(nchunks):
+    endtr += np.sum(nrec[begsht:endsht])
+    bounds.append((begsht, endsht, begtr, endtr))
+    begsht = endsht
+    endsht += chunk_size
+    begtr = endtr
+  return np.asarray(bounds, dtype='int64').reshape(-1, 4)
+
+
+@pytest.mark.parametrize('nshots,chunk_size', [(10, 5), (11, 5), (13, 5),
+                                               (3, 5), (0, 5), (7, 1)])
+def test_matches_loop(nshots, chunk_size):
+  nrec = np.random.default_rng(nshots).integers(1, 20, nshots)
+  np.testing.assert_array_equal(chunk_bounds(nrec, chunk_size),
+                                _loop_bounds(nrec, chunk_size))
+
+
+def test_traces_cover_shots():
+  nrec = np.array([3, 1, 4, 1, 5, 9, 2, 6])
+  bounds = chunk_bounds(nrec, 4)
+  for begsht, endsht, begtr, endtr in bounds:
+    assert endtr - begtr == np.sum(nrec[begsht:endsht])
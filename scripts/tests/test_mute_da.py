@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('regio')
+pytest.importorskip('mdsuops')
+pytest.importorskip('sivu')
+
+from mdsuops.mute import mute
+from mute_da import mute_shots
+from mute_ops import mute_window
+from test_mute_ops import synthetic_shots
+
+
+def test_window_matches_mdsuops():
+  rng = np.random.default_rng(1)
+  data = rng.standard_normal([8, 600]).astype('float32')
+  for t0, v0 in ((0.1, 1.45), (0.4, 1.5)):
+    pars = dict(dt=0.004,
+                dx=0.025,
+                v0=v0,
+                t0=t0,
+                tp=0.5,
+                half=False,
+                hyper=True)
+    np.testing.assert_allclose(mute_window(data, **pars),
+                               np.squeeze(mute(data, **pars)),
+                               atol=1e-5)
+
+
+def test_batched_matches_mdsuops():
+  data, srcx, srcy, nrec, strm, recx, recy = synthetic_shots(0.002)
+  ref = mute_shots(data, srcx, srcy, nrec, strm, recx, recy)
+  bat = mute_shots(data, srcx, srcy, nrec, strm, recx, recy, engine='batched')
+  np.testing.assert_allclose(bat, ref, atol=1e-5)
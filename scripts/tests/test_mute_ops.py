@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from mute_ops import mute_window, mute_streamers, mute_onsets, mute_batch
+
+
+def synthetic_shots(dt):
+  """ Two shots with two streamer segments each and random traces """
+  rng = np.random.default_rng(0)
+  nrec = np.array([12, 10], dtype='int32')
+  ntr, nt = int(nrec.sum()), int(2.0 / dt)
+  strm = np.concatenate([np.arange(1, 7), np.arange(1, 7)] +
+                        [np.arange(1, 6), np.arange(1, 6)]).astype('float32')
+  srcx = np.array([1.0, 1.5], dtype='float32')
+  srcy = np.array([2.0, 2.1], dtype='float32')
+  # Receivers behind the source (one near and one far streamer)
+  recx = np.zeros(ntr, dtype='float32')
+  recy = np.zeros(ntr, dtype='float32')
+  beg = 0
+  for isht in range(len(nrec)):
+    off = 0.1 + 0.025 * np.arange(nrec[isht])
+    off[nrec[isht] // 2:] += 0.4
+    recx[beg:beg + nrec[isht]] = srcx[isht] + off
+    recy[beg:beg + nrec[isht]] = srcy[isht]
+    beg += nrec[isht]
+  data = rng.standard_normal([ntr, nt]).astype('float32')
+  return data, srcx, srcy, nrec, strm, recx, recy
+
+
+@pytest.mark.parametrize('dt', [0.002, 0.004])
+@pytest.mark.parametrize('vel', [1450.0, 1500.0])
+def test_batch_matches_streamer_mute(dt, vel):
+  data, srcx, srcy, nrec, strm, recx, recy = synthetic_shots(dt)
+  ref = np.zeros(data.shape, dtype='float32')
+  ntrw = 0
+  for isht in range(len(nrec)):
+    shtw = slice(ntrw, ntrw + nrec[isht])
+    mute_streamers(data[shtw],
+                   srcx[isht],
+                   srcy[isht],
+                   nrec[isht],
+                   strm[shtw],
+                   recx[shtw],
+                   recy[shtw],
+                   mute_window,
+                   vel=vel,
+                   dt=dt,
+                   out=ref[shtw])
+    ntrw += nrec[isht]
+  onsets = mute_onsets(srcx, srcy, nrec, strm, recx, recy, vel)
+  bat = mute_batch(data, onsets, dt, block=5)
+  np.testing.assert_allclose(bat, ref, atol=1e-5)
+
+
+def test_window_onsets():
+  dt, nt = 0.004, 500
+  data = np.ones([3, nt], dtype='float32')
+  out = mute_window(data, dt=dt, dx=0.025, v0=1.5, t0=0.2, tp=0.5)
+  for ix in range(3):
+    onset = np.sqrt(0.2**2 + (ix * 0.025 / 1.5)**2)
+    it = int(np.ceil(onset / dt))
+    assert np.all(out[ix, :it] == 0.0)
+    assert np.all(out[ix, it + 1:] > 0.0)
+    np.testing.assert_allclose(out[ix, int((onset + 0.5) / dt) + 1:], 1.0)
+
+
+def test_mute_batch_zeroes_before_onset():
+  dt, nt = 0.002, 100
+  data = np.ones([2, nt], dtype='float32')
+  onsets = np.array([0.05, np.inf])
+  out = mute_batch(data, onsets, dt, tp=0.02)
+  it = int(round(0.05 / dt))
+  assert np.all(out[0, :it] == 0.0)
+  np.testing.assert_allclose(out[0, it + 11:], 1.0)
+  assert np.all(out[1] == 0.0)
+
+
+def test_onsets_start_at_direct_arrival():
+  data, srcx, srcy, nrec, strm, recx, recy = synthetic_shots(0.002)
+  onsets = mute_onsets(srcx, srcy, nrec, strm, recx, recy, vel=1500.0)
+  # First trace of each shot is the start of a segment
+  for itr, isht in ((0, 0), (12, 1)):
+    dist = np.hypot(srcx[isht] - recx[itr], srcy[isht] - recy[itr])
+    assert onsets[itr] == pytest.approx(dist / 1500.0)
+  assert np.all(np.diff(onsets[:6]) > 0)
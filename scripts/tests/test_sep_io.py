@@ -0,0 +1,56 @@
+import os
+import numpy as np
+
+from sep_io import (copy_bytes, read_axes, sep_binary, write_header,
+                    concat_files)
+
+
+def test_copy_bytes_ranges_from_open_file(tmpdir):
+  src = os.path.join(str(tmpdir), 'src')
+  dst = os.path.join(str(tmpdir), 'dst')
+  data = np.arange(1000, dtype='>f4')
+  data.tofile(src)
+  ranges = [(0, 10), (15, 20), (100, 600), (999, 1000)]
+  with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+    for beg, end in ranges:
+      copy_bytes(fsrc, fdst, 4 * (end - beg), block=64, offset=4 * beg)
+  out = np.fromfile(dst, dtype='>f4')
+  np.testing.assert_array_equal(
+      out, np.concatenate([data[beg:end] for beg, end in ranges]))
+
+
+def test_copy_bytes_from_path(tmpdir):
+  src = os.path.join(str(tmpdir), 'src')
+  dst = os.path.join(str(tmpdir), 'dst')
+  data = np.arange(100, dtype='>f4')
+  data.tofile(src)
+  with open(dst, 'wb') as fdst:
+    copy_bytes(src, fdst, offset=40, block=16)
+  np.testing.assert_array_equal(np.fromfile(dst, dtype='>f4'), data[10:])
+
+
+def test_concat_files(tmpdir):
+  fnames = []
+  for k, ntr in enumerate([3, 2]):
+    fname = os.path.join(str(tmpdir), 'f%d.H' % k)
+    np.full([ntr, 4], k, dtype='>f4').tofile(fname + '@')
+    write_header(fname, [4, ntr], [0.0, 0.0], [0.004, 1.0], fname + '@')
+    fnames.append(fname)
+  output = os.path.join(str(tmpdir), 'all.H')
+  concat_files(fnames, output, block=8)
+  n, o, d = read_axes(output)
+  assert n == [4, 5] and d == [0.004, 1.0]
+  out = np.fromfile(output + '@', dtype='>f4').reshape(5, 4)
+  np.testing.assert_array_equal(out[:, 0], [0, 0, 0, 1, 1])
+
+
+def test_relative_paths(tmpdir, monkeypatch):
+  monkeypatch.chdir(str(tmpdir))
+  os.makedirs(os.path.join('out', 'static'))
+  fname = os.path.join('out', 'static', 'f.H')
+  np.zeros([2, 4], dtype='>f4').tofile(fname + '@')
+  write_header(fname, [4, 2], [0.0, 0.0], [0.004, 1.0], fname + '@')
+  assert sep_binary(fname) == os.path.abspath(fname + '@')
+  concat_files([fname, fname], os.path.join('out', 'all.H'))
+  assert sep_binary(os.path.join('out', 'all.H')) == os.path.abspath(
+      os.path.join('out', 'all.H@'))
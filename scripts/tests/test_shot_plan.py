@@ -0,0 +1,54 @@
+import numpy as np
+
+from shot_plan import affinity_chunks, shared_files
+
+
+def _random_plan(nshots=200, nfiles=20, seed=0):
+  rng = np.random.default_rng(seed)
+  fileids = []
+  for _ in range(nshots):
+    ifile = int(rng.integers(nfiles))
+    # Some shots straddle two consecutive files
+    fileids.append([ifile, ifile + 1] if rng.random() < 0.2 else [ifile])
+  return fileids, rng.uniform(1.0, 2.0, nshots)
+
+
+def test_every_shot_once():
+  fileids, costs = _random_plan()
+  chnks = affinity_chunks(fileids, costs, 7)
+  assert len(chnks) == 7
+  np.testing.assert_array_equal(np.sort(np.concatenate(chnks)),
+                                np.arange(len(fileids)))
+
+
+def test_groups_not_split():
+  fileids, costs = _random_plan()
+  chnks = affinity_chunks(fileids, costs, 5)
+  owner = {}
+  for ichnk, chnk in enumerate(chnks):
+    for k in chnk:
+      assert owner.setdefault(tuple(fileids[k]), ichnk) == ichnk
+
+
+def test_balanced_and_few_shared_files():
+  fileids, costs = _random_plan(nshots=2000, nfiles=100)
+  nchnks = 8
+  chnks = affinity_chunks(fileids, costs, nchnks)
+  ccosts = [sum(costs[k] for k in chnk) for chnk in chnks]
+  assert max(ccosts) < 1.1 * np.sum(costs) / nchnks
+  # Files are only shared across the cuts between chunks
+  nshared = shared_files([[fileids[k] for k in chnk] for chnk in chnks])
+  # The shots span at most two consecutive files here, so each cut shares
+  # at most two files
+  assert nshared <= 2 * (nchnks - 1)
+  # A round-robin split shares nearly every file
+  rr = [[fileids[k] for k in range(i, len(fileids), nchnks)]
+        for i in range(nchnks)]
+  assert shared_files(rr) > 10 * nshared
+
+
+def test_more_chunks_than_groups():
+  chnks = affinity_chunks([[0], [0], [1]], [1.0, 1.0, 1.0], 4)
+  assert len(chnks) == 4
+  assert sorted(k for chnk in chnks for k in chnk) == [0, 1, 2]
+  assert affinity_chunks([], [], 3) == [[], [], []]
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import pytest
+
+segyio = pytest.importorskip('segyio')
+
+from header_index import write_header_index, DEAD_TID
+from shot_reader import FileCache, ShotReader, trace_ranges
+
+
+class _Traces:
+
+  def __init__(self):
+    self.closed = False
+
+  def close(self):
+    self.closed = True
+
+
+def _load(segy):
+  return _Traces(), np.zeros(10, dtype='int64'), np.zeros(5, dtype='int32')
+
+
+def test_file_cache_lru():
+  cache = FileCache(_load, max_files=2)
+  a = cache.get('a')
+  cache.get('b')
+  assert cache.get('a') is a
+  # b is the least recently used file
+  b = cache.get('b')
+  cache.get('c')
+  assert len(cache) == 2 and a[0].closed and not b[0].closed
+  assert (cache.hits, cache.misses, cache.evictions) == (2, 3, 1)
+  cache.clear()
+  assert len(cache) == 0 and b[0].closed and cache.nbytes == 0
+
+
+def test_file_cache_max_bytes():
+  # Each entry holds 100 bytes of headers
+  cache = FileCache(_load, max_files=10, max_bytes=250)
+  for segy in 'abcd':
+    cache.get(segy)
+  assert len(cache) == 2 and cache.nbytes == 200
+  # The requested file is kept even if it alone exceeds the budget
+  cache = FileCache(_load, max_files=10, max_bytes=50)
+  cache.get('a')
+  assert len(cache) == 1
+
+
+def test_trace_ranges():
+  np.testing.assert_array_equal(trace_ranges([1, 2, 3, 7, 9, 10]),
+                                [[1, 4], [7, 8], [9, 11]])
+  assert trace_ranges([]).shape == (0, 2)
+
+
+def _write_segy(path, srcs, ns=16):
+  """ Writes a SEG-Y file with one trace per (srcy, srcx, tid) of srcs """
+  spec = segyio.spec()
+  spec.format = 5
+  spec.samples = np.arange(ns) * 4.0
+  spec.tracecount = len(srcs)
+  data = np.zeros([len(srcs), ns], dtype='float32')
+  with segyio.create(path, spec) as f:
+    for itr, (srcy, srcx, tid) in enumerate(srcs):
+      data[itr] = 1000 * srcx + itr + np.arange(ns) / ns
+      f.header[itr] = {
+          segyio.TraceField.SourceY: srcy,
+          segyio.TraceField.SourceX: srcx,
+          segyio.TraceField.GroupY: srcy + itr,
+          segyio.TraceField.GroupX: srcx + itr,
+          segyio.TraceField.CDP_TRACE: itr + 1,
+          segyio.TraceField.TraceIdentificationCode: tid,
+      }
+      f.trace[itr] = data[itr]
+  return data
+
+
+@pytest.fixture
+def survey(tmpdir):
+  # Shot (1, 2) spans both files and is interleaved with shot (1, 3)
+  srcs = {
+      'f0.sgy': [(1, 2, 1), (1, 2, 1), (1, 3, 1), (1, 2, DEAD_TID), (1, 2, 1)],
+      'f1.sgy': [(1, 2, 1), (1, 3, 1), (1, 3, 1)],
+  }
+  segys, data = [], {}
+  for name, fsrcs in srcs.items():
+    segy = os.path.join(str(tmpdir), name)
+    data[segy] = _write_segy(segy, fsrcs)
+    segys.append(segy)
+  index_dir = os.path.join(str(tmpdir), 'hdr_index')
+  write_header_index(segys, index_dir)
+  return index_dir, segys, data
+
+
+def test_get_shot(survey):
+  index_dir, segys, data = survey
+  reader = ShotReader(index_dir, max_files=1)
+  shot = reader.get_shot(1, 2, segys)
+  assert shot['nrec'] == 5
+  np.testing.assert_array_equal(
+      shot['data'],
+      np.concatenate([data[segys[0]][[0, 1, 3, 4]], data[segys[1]][[0]]]))
+  np.testing.assert_array_equal(shot['recx'], [2, 3, 5, 6, 2])
+  np.testing.assert_array_equal(shot['streamer'], [1, 2, 4, 5, 1])
+  live = reader.get_shot(1, 2, segys, live_only=True)
+  assert live['nrec'] == 4
+  np.testing.assert_array_equal(live['recx'], [2, 3, 6, 2])
+  # Only one file is kept open
+  assert len(reader.cache) == 1 and reader.cache.evictions >= 1
+  reader.close()
+
+
+def test_get_shot_missing(survey):
+  index_dir, segys, _ = survey
+  reader = ShotReader(index_dir)
+  shot = reader.get_shot(9, 9, segys)
+  assert shot['nrec'] == 0 and shot['data'].shape == (0, 16)
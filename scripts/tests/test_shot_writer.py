@@ -0,0 +1,104 @@
+import os
+import numpy as np
+
+from sep_io import read_axes, sep_binary
+from shot_writer import ShotWriter, SHOT_KEYS
+
+
+def _fnames(tmpdir):
+  return {key: os.path.join(str(tmpdir), key + '.H') for key in SHOT_KEYS}
+
+
+def _shot(isht, nrec, nt=8):
+  return {
+      'srcx': 100.0 + isht,
+      'srcy': 200.0 + isht,
+      'recx': np.arange(nrec, dtype='float32') + 10 * isht,
+      'recy': np.arange(nrec, dtype='float32') - 10 * isht,
+      'nrec': nrec,
+      'streamer': np.arange(1, nrec + 1, dtype='float32'),
+      'data': np.full([nrec, nt], isht, dtype='float32') +
+              np.arange(nt, dtype='float32'),
+  }
+
+
+def _read(fname):
+  """ Reads a SEP file written by ShotWriter (xdr_float) """
+  n, o, d = read_axes(fname)
+  data = np.fromfile(sep_binary(fname), dtype='>f4')
+  return n, d, data.reshape(n[::-1])
+
+
+def _check_outputs(fnames, shots, dt):
+  nrec = [shot['nrec'] for shot in shots]
+  n, d, srcx = _read(fnames['srcx'])
+  assert n == [len(shots)]
+  np.testing.assert_array_equal(srcx, [shot['srcx'] for shot in shots])
+  n, d, recx = _read(fnames['recx'])
+  assert n == [sum(nrec)]
+  np.testing.assert_array_equal(recx,
+                                np.concatenate([s['recx'] for s in shots]))
+  n, d, data = _read(fnames['shots'])
+  assert n == [shots[0]['data'].shape[1], sum(nrec)]
+  assert d[0] == dt
+  np.testing.assert_array_equal(data,
+                                np.concatenate([s['data'] for s in shots]))
+  _, _, nrecs = _read(fnames['nrec'])
+  np.testing.assert_array_equal(nrecs, nrec)
+
+
+def test_headers_written_at_close(tmpdir):
+  fnames = _fnames(tmpdir)
+  shots = [_shot(isht, nrec) for isht, nrec in enumerate([3, 5, 2, 4])]
+  # A small budget flushes after every shot
+  writer = ShotWriter(fnames, dt=0.004, max_bytes=1)
+  for shot in shots:
+    writer.write(shot)
+  assert not any(os.path.exists(fname) for fname in fnames.values())
+  writer.close()
+  _check_outputs(fnames, shots, 0.004)
+
+
+def test_no_shots_no_outputs(tmpdir):
+  fnames = _fnames(tmpdir)
+  writer = ShotWriter(fnames)
+  writer.skip(1.0, 2.0)
+  writer.close()
+  assert os.listdir(str(tmpdir)) == []
+
+
+def test_resume_after_interrupt(tmpdir):
+  fnames = _fnames(tmpdir)
+  manifest = os.path.join(str(tmpdir), 'shots.manifest')
+  shots = [_shot(isht, nrec) for isht, nrec in enumerate([3, 5, 2, 4, 1])]
+  writer = ShotWriter(fnames, dt=0.004, manifest=manifest)
+  writer.write(shots[0])
+  writer.write(shots[1])
+  writer.flush()
+  # Buffered (never saved) shot, then a partial append of a crashed flush
+  writer.write(shots[2])
+  for key in SHOT_KEYS:
+    with open(fnames[key] + '@', 'ab') as f:
+      f.write(b'\x01' * 13)
+  del writer
+
+  writer = ShotWriter(fnames, dt=0.004, manifest=manifest, resume=True)
+  assert writer.done == {(s['srcy'], s['srcx']) for s in shots[:2]}
+  assert (writer.nshots, writer.ntraces) == (2, 8)
+  for shot in shots[2:]:
+    if (shot['srcy'], shot['srcx']) not in writer.done:
+      writer.write(shot)
+  writer.close()
+  _check_outputs(fnames, shots, 0.004)
+
+
+def test_resume_without_manifest(tmpdir):
+  fnames = _fnames(tmpdir)
+  manifest = os.path.join(str(tmpdir), 'shots.manifest')
+  shots = [_shot(isht, nrec) for isht, nrec in enumerate([2, 3])]
+  writer = ShotWriter(fnames, manifest=manifest, resume=True)
+  assert len(writer.done) == 0
+  for shot in shots:
+    writer.write(shot)
+  writer.close()
+  _check_outputs(fnames, shots, 0.002)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from spatial_index import NearestIndex
+
+
+def _argmin_nearest(crds, pts):
+  d2 = np.sum((pts[:, np.newaxis, :] - crds[np.newaxis, :, :])**2, axis=-1)
+  return np.argmin(d2, axis=1)
+
+
+def test_matches_argmin():
+  rng = np.random.default_rng(0)
+  crds = rng.uniform(0.0, 10.0, [500, 2])
+  pts = rng.uniform(-1.0, 11.0, [300, 2])
+  np.testing.assert_array_equal(
+      NearestIndex(crds).nearest(pts), _argmin_nearest(crds, pts))
+
+
+def test_ties_resolve_to_lowest_index():
+  # Repeated coordinates and a query equidistant to two points
+  crds = np.array([[1.0, 1.0], [0.0, 0.0], [1.0, 1.0], [0.0, 2.0]])
+  pts = np.array([[1.0, 1.0], [0.0, 1.0], [0.1, 0.0]])
+  np.testing.assert_array_equal(NearestIndex(crds).nearest(pts), [0, 0, 1])
+  np.testing.assert_array_equal(
+      NearestIndex(crds).nearest(pts), _argmin_nearest(crds, pts))
+
+
+def test_collinear_far_queries():
+  # Sources along a single line queried far away from it
+  crds = np.stack([np.zeros(1000), np.linspace(0.0, 25.0, 1000)], axis=-1)
+  pts = np.stack([np.full(10, 2.0), np.linspace(-1.0, 26.0, 10)], axis=-1)
+  nidx = NearestIndex(crds).nearest(pts)
+  np.testing.assert_array_equal(nidx, _argmin_nearest(crds, pts))
+  assert nidx[0] == 0 and nidx[-1] == 999
+
+
+def test_collinear_ties():
+  # Repeated sources on a line and queries halfway between two of them
+  line = np.stack([np.zeros(100), np.arange(100.0)], axis=-1)
+  crds = np.concatenate([line, line])
+  pts = np.stack([np.full(99, 2.0), np.arange(99) + 0.5], axis=-1)
+  nidx = NearestIndex(crds).nearest(pts)
+  np.testing.assert_array_equal(nidx, np.arange(99))
+  np.testing.assert_array_equal(nidx, _argmin_nearest(crds, pts))
+
+
+def test_grid_shape():
+  crds = np.array([[0.0, 0.0], [1.0, 1.0]])
+  gy, gx = np.meshgrid(np.linspace(0, 1, 3), np.linspace(0, 1, 4), indexing='ij')
+  nidx = NearestIndex(crds).nearest(np.stack([gy, gx], axis=-1))
+  assert nidx.shape == (12,)
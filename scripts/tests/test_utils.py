@@ -0,0 +1,43 @@
+import numpy as np
+
+from utils import KeyIndex, pack_coords
+
+
+def test_pack_coords_distinct():
+  srcy = np.array([0, 1, 0, -1, 6072400])
+  srcx = np.array([1, 0, -1, 0, 605000])
+  assert len(np.unique(pack_coords(srcy, srcx))) == len(srcy)
+
+
+def test_find_duplicates_in_order():
+  srcy = np.array([5, 3, 5, 7, 5, 3])
+  srcx = np.array([1, 2, 1, 1, 1, 2])
+  kidx = KeyIndex(srcy, srcx)
+  np.testing.assert_array_equal(kidx.find(5, 1), [0, 2, 4])
+  np.testing.assert_array_equal(kidx.find(3, 2), [1, 5])
+  np.testing.assert_array_equal(kidx.find(7, 1), [3])
+
+
+def test_find_missing():
+  kidx = KeyIndex(np.array([5, 3]), np.array([1, 2]))
+  # Missing keys below, between and above the stored keys
+  for srcy, srcx in ((0, 0), (4, 0), (5, 2), (9, 9)):
+    assert len(kidx.find(srcy, srcx)) == 0
+  assert len(KeyIndex(np.array([]), np.array([])).find(1, 1)) == 0
+
+
+def test_first():
+  srcy = np.array([5, 3, 5, 7, 5, 3, -2])
+  srcx = np.array([1, 2, 1, 1, 1, 2, -4])
+  mask = KeyIndex(srcy, srcx).first()
+  np.testing.assert_array_equal(mask, [1, 1, 0, 1, 0, 0, 1])
+  # Same as keeping the first occurrence of each coordinate pair
+  _, first = np.unique(np.stack([srcy, srcx], axis=1),
+                       axis=0,
+                       return_index=True)
+  np.testing.assert_array_equal(np.flatnonzero(mask), np.sort(first))
+
+
+def test_first_empty():
+  mask = KeyIndex(np.array([]), np.array([])).first()
+  assert mask.dtype == bool and len(mask) == 0
@@ -1,5 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 
 
 def splitnum(num, div):
@@ -23,6 +26,95 @@ def chunks(lst, nchnks):
       end += splits[i + 1]
 
 
+def pmap(func, items, nworkers=1, chunksize=1):
+  """
+  Maps a function over items and yields the results in order
+
+  Uses a pool of nworkers processes if nworkers > 1 (func must be picklable)
+  """
+  if nworkers <= 1:
+    for item in items:
+      yield func(item)
+  else:
+    with Pool(nworkers) as pool:
+      for res in pool.imap(func, items, chunksize):
+        yield res
+
+
+def prefetch(func, items, depth=0):
+  """
+  Applies a function to items in a background thread and yields the
+  (item, result) pairs in order
+
+  The thread runs at most depth items ahead of the consumer, which bounds
+  the memory held by the prefetched results. A single thread is used so
+  func does not need to be thread safe
+
+  Parameters:
+    func  - function called as func(*item)
+    items - iterable of argument tuples (consumed in the calling thread)
+    depth - number of items prefetched ahead (0 runs func in the caller) [0]
+  """
+  if depth <= 0:
+    for item in items:
+      yield item, func(*item)
+    return
+  with ThreadPoolExecutor(max_workers=1) as pool:
+    pending = deque()
+    for item in items:
+      pending.append((item, pool.submit(func, *item)))
+      if len(pending) > depth:
+        item, fut = pending.popleft()
+        yield item, fut.result()
+    while len(pending) > 0:
+      item, fut = pending.popleft()
+      yield item, fut.result()
+
+
+def pack_coords(srcy, srcx):
+  """ Packs integer (y, x) coordinates into int64 keys (y << 32 | x) """
+  srcy = np.asarray(srcy).astype('int64')
+  srcx = np.asarray(srcx).astype('int64')
+  return (srcy << 32) | (srcx & 0xffffffff)
+
+
+class KeyIndex:
+  """ Sorted packed coordinate keys for finding the entries of a source """
+
+  def __init__(self, srcy, srcx):
+    """
+    KeyIndex constructor
+
+    Parameters:
+      srcy - y source coordinate of each entry [n]
+      srcx - x source coordinate of each entry [n]
+    """
+    keys = pack_coords(srcy, srcx)
+    # Stable so that the entries of a source stay in their original order
+    self.perm = np.argsort(keys, kind='stable')
+    self.keys = keys[self.perm]
+    self.nbytes = self.perm.nbytes + self.keys.nbytes
+
+  def __len__(self):
+    return len(self.keys)
+
+  def find(self, srcy, srcx) -> np.ndarray:
+    """ Returns the sorted indices of the entries of a source """
+    key = pack_coords(srcy, srcx)
+    beg = np.searchsorted(self.keys, key, side='left')
+    end = np.searchsorted(self.keys, key, side='right')
+    return self.perm[beg:end]
+
+  def first(self) -> np.ndarray:
+    """ Returns a mask [n] of the first entry of each source """
+    mask = np.zeros(len(self.keys), dtype=bool)
+    if len(self.keys) > 0:
+      new = np.ones(len(self.keys), dtype=bool)
+      new[1:] = self.keys[1:] != self.keys[:-1]
+      mask[self.perm[new]] = True
+    return mask
+
+
 def plot_acq(
     srcx,
     srcy,